@@ -8,10 +8,15 @@
 # @author Régis Clouard
 
 import random
-import copy
+import os
 import time
+import atexit
+import weakref
 from math import sqrt
 import utils
+import diagnostics
+from checkpoint import Checkpoint, Checkpointer, load_checkpoint, read_weights, write_weights
+from cells import Grid, DistanceField, UNREACHABLE, CELL_CHARS, WALL, GROUND, UNKNOWN, LETTUCE, STONE, POND
 
 DIRECTIONTABLE = [(0, -1), (1, 0), (0, 1), (-1, 0)] # North, East, South, West
 
@@ -19,10 +24,21 @@ class TortoiseBrain:
     """
     The base class for various flavors of the tortoise brain.
     This an implementation of the Strategy design pattern.
+    Brains draw their random numbers from self.rng: the global
+    random generator, unless seed() gave them their own.
     """
+    rng = random
+
+    def seed( self, seed ):
+        self.rng = random.Random(seed)
+
     def think( self, sensor ):
         raise Exception("Invalid Brain class, think() not implemented")
 
+    def end( self ):
+        """ Called once an episode is over. """
+        pass
+
 class RandomBrain( TortoiseBrain ):
     """
     An example of simple tortoise brain: acts randomly...
@@ -31,7 +47,7 @@ class RandomBrain( TortoiseBrain ):
         pass
 
     def think( self, sensor ):
-        return random.choice(['eat', 'drink', 'left', 'right', 'forward', 'forward', 'wait'])
+        return self.rng.choice(('eat', 'drink', 'left', 'right', 'forward', 'forward', 'wait'))
 
 class ReflexBrain( TortoiseBrain ):
     def init( self, grid_size ):
@@ -58,10 +74,10 @@ class ReflexBrain( TortoiseBrain ):
         if sensor.water_here and sensor.drink_level < 100: return 'drink'
         # Nothing to do: move
         if sensor.free_ahead:
-            return random.choice(['forward', 'right', 'forward', 'wait', 'forward', 'forward', 'forward'])
+            return self.rng.choice(('forward', 'right', 'forward', 'wait', 'forward', 'forward', 'forward'))
         else:
-            return random.choice(['right', 'left'])
-        return random.choice(['eat', 'drink', 'left', 'right', 'forward', 'forward', 'wait'])
+            return self.rng.choice(('right', 'left'))
+        return self.rng.choice(('eat', 'drink', 'left', 'right', 'forward', 'forward', 'wait'))
 
  #  ______                               _              
  # |  ____|                             (_)             
@@ -70,14 +86,26 @@ class ReflexBrain( TortoiseBrain ):
  # | |____   >  <  |  __/ | |    | (__  | | \__ \ |  __/
  # |______| /_/\_\  \___| |_|     \___| |_| |___/  \___|
 
-# Character representation of environement elements 
-WALL = 'X'
-GROUND = '.'
-UNKNOWN = '?'
-LETTUCE = 'l'
-POUND = 'p'
-STONE = 's'
-FREE = 'f'
+# Environement elements are coded as in the tortoise world (see cells.py)
+POUND = POND
+
+class Parameters():
+    """
+    The weights of the linear Q-function, referenced by every state of
+    a brain and updated in place. shared() loads a weights file once per
+    process and then always returns the same Parameters.
+    """
+    loaded = {}
+
+    def __init__( self, weights ):
+        self.weights = weights
+
+    @classmethod
+    def shared( cls, filename ):
+        key = os.path.abspath(filename)
+        if key not in cls.loaded:
+            cls.loaded[key] = Parameters(read_weights(filename))
+        return cls.loaded[key]
 
 class GameState():
     """ 
@@ -85,38 +113,42 @@ class GameState():
     You can modify it or even replace it with your own class.
     """
 
-    def __init__(self, grid_size =0): 
+    def __init__(self, grid_size =0, weights = None): 
         if grid_size > 0:
             self.size = grid_size
-            self.worldmap = [ [  ((y in [0, self.size - 1] or  x in [0, self.size - 1]) and WALL) or UNKNOWN
-                                 for x in range(self.size) ] for y in range(self.size) ]
-        self.lettuce_positions = []
-        self.water_positions = []
+            self.worldmap = Grid(self.size, WALL, UNKNOWN)
+            # the walking distances to the known lettuces and ponds, around the known stones
+            self.lettuce_distances = DistanceField(self.worldmap)
+            self.water_distances = DistanceField(self.worldmap)
+        # the known lettuces and ponds, as sets of positions
+        self.lettuce_positions = set()
+        self.water_positions = set()
         self.eaten = 0
-        # weights :
-        self.wi = []
-        self.load_weights("weights.txt")
-        #print(self.wi)
-        # features
-        self.f = []
-        self.f.append(self.distance_water)
-        self.f.append(self.distance_dog)
-        self.f.append(self.distance_lettuce)
-        self.f.append(self.exploration_rate)
-        self.f.append(self.remaining_lettuce)
-        self.f.append(self.health_level)
-        self.f.append(self.drink_level)
-
-        self.Q = lambda s, a: sum([self.wi[j] * self.f[j](s, a) for j in range(7)])
+        # weights : the given Parameters or list (updated in place), or those of weights.txt
+        if weights is None:
+            weights = Parameters.shared("weights.txt")
+        elif not isinstance(weights, Parameters):
+            weights = Parameters(weights)
+        self.parameters = weights
+        self.wi = weights.weights
+
+    def Q( self, state, action ):
+        return self.value(self.feature_vector(state, action))
+
+    def feature_vector( self, state = None, action = None ):
+        """ Returns the features of Q, none of which depends on the action. """
+        return [feature(self, state, action) for feature in self.FEATURES]
+
+    def value( self, features ):
+        """ Returns Q for the features, as the weighted sum of Q(). """
+        wi = self.wi
+        return sum([wi[j] * features[j] for j in range(7)])
 
     def save_weights(self, filename):
-        with open(filename, 'w') as file:
-            for weight in self.wi:
-                file.write(f"{weight}\n")
+        write_weights(filename, self.wi)
 
     def load_weights(self, filename):
-        with open(filename, 'r') as file:
-            self.wi = [float(line.strip()) for line in file]
+        self.wi[:] = read_weights(filename)
 
     def distance_manhattan(self, x1, y1, x2, y2):
         return abs(x1 - x2) + abs(y1 - y2)
@@ -125,26 +157,22 @@ class GameState():
     # Feature functions
 
     def exploration_rate(self, state, action):
-        explored_ratio = sum(1 for row in self.worldmap for cell in row if cell != '?') / (len(self.worldmap) ** 2)
+        explored_ratio = (self.size * self.size - self.worldmap.counts[UNKNOWN]) / (self.size ** 2)
         return explored_ratio
 
     def distance_dog(self, state, action):
         return self.distance_manhattan(self.x, self.y, self.dogx, self.dogy) / self.distance_manhattan(0, 0, self.size, self.size)
 
     def distance_water(self, state, action):
-        if len(self.water_positions) == 0:
+        distance = self.water_distances.distance(self.x, self.y)
+        if distance == UNREACHABLE:
             return 1
-        distance = self.distance_manhattan(self.x, self.y, self.water_positions[0][0], self.water_positions[0][1])
-        for pond in self.water_positions :
-            distance = min(distance, self.distance_manhattan(self.x, self.y, pond[0], pond[1]))
         return distance / self.distance_manhattan(0, 0, self.size, self.size)
 
     def distance_lettuce(self, state, action):
-        if len(self.lettuce_positions) == 0:
+        distance = self.lettuce_distances.distance(self.x, self.y)
+        if distance == UNREACHABLE:
             return 1
-        distance = self.distance_manhattan(self.x, self.y, self.lettuce_positions[0][0], self.lettuce_positions[0][1])
-        for lettuce in self.lettuce_positions:
-           distance = min(distance, self.distance_manhattan(self.x, self.y, lettuce[0], lettuce[1]))
         return distance / self.distance_manhattan(0, 0, self.size, self.size)
 
     def eaten_lettuce(self, state, action):
@@ -164,13 +192,22 @@ class GameState():
 
     def drink_level(self, state, action):
         return self.drink_level / 100
+
+    # The features of Q, called as FEATURES[j](self, state, action): the
+    # health_level and drink_level attributes of a state hide the methods
+    FEATURES = (distance_water, distance_dog, distance_lettuce, exploration_rate, remaining_lettuce, health_level, drink_level)
     #################################
 
     def __deepcopy__( self, memo ):
-        state = GameState()
-        state.size = self.size
-        state.worldmap = copy.deepcopy(self.worldmap, memo)
+        """ Copies the state, sharing its Parameters. """
+        state = GameState(0, self.parameters)
         state.size = self.size
+        state.worldmap = self.worldmap.copy()
+        state.lettuce_distances = self.lettuce_distances.copy(state.worldmap)
+        state.water_distances = self.water_distances.copy(state.worldmap)
+        state.lettuce_positions = self.lettuce_positions.copy()
+        state.water_positions = self.water_positions.copy()
+        state.eaten = self.eaten
         state.x = self.x
         state.y = self.y
         state.direction = self.direction
@@ -205,29 +242,28 @@ class GameState():
 
         # Update the map
         (directionx, directiony) = DIRECTIONTABLE[self.direction]
+        worldmap = self.worldmap
         if sensor.lettuce_here:
-            self.worldmap[self.x][self.y] = LETTUCE
-            if (self.x, self.y) not in self.lettuce_positions:
-                self.lettuce_positions.append((self.x, self.y))
+            worldmap.set(self.x, self.y, LETTUCE)
+            self.add_lettuce(self.x, self.y)
         elif sensor.water_here:
-            self.worldmap[self.x][self.y] = POUND
-            if (self.x, self.y) not in self.water_positions:
-                self.water_positions.append((self.x, self.y))
+            worldmap.set(self.x, self.y, POUND)
+            self.add_pond(self.x, self.y)
         else:
-            self.worldmap[self.x][self.y] = GROUND
+            worldmap.set(self.x, self.y, GROUND)
 
         if sensor.lettuce_ahead:
-            self.worldmap[self.x + directionx][self.y + directiony] = LETTUCE
-            if (self.x + directionx, self.y + directiony) not in self.lettuce_positions:
-                self.lettuce_positions.append((self.x + directionx, self.y + directiony))
+            worldmap.set(self.x + directionx, self.y + directiony, LETTUCE)
+            self.add_lettuce(self.x + directionx, self.y + directiony)
         elif sensor.water_ahead:
-            self.worldmap[self.x + directionx][self.y + directiony] = POUND
-            if (self.x + directionx, self.y + directiony) not in self.water_positions:
-                self.water_positions.append((self.x + directionx, self.y + directiony))
+            worldmap.set(self.x + directionx, self.y + directiony, POUND)
+            self.add_pond(self.x + directionx, self.y + directiony)
         elif sensor.free_ahead:
-            self.worldmap[self.x + directionx][self.y + directiony] = GROUND
-        elif self.worldmap[self.x + directionx][self.y + directiony] == UNKNOWN:
-            self.worldmap[self.x + directionx][self.y + directiony] = STONE
+            worldmap.set(self.x + directionx, self.y + directiony, GROUND)
+        elif worldmap.get(self.x + directionx, self.y + directiony) == UNKNOWN:
+            worldmap.set(self.x + directionx, self.y + directiony, STONE)
+            self.lettuce_distances.block(self.x + directionx, self.y + directiony)
+            self.water_distances.block(self.x + directionx, self.y + directiony)
 
         # Update the dog position
         if directionx == 0:
@@ -237,41 +273,190 @@ class GameState():
             self.dogx = self.x + directionx * sensor.dog_front
             self.dogy = self.y + directionx * sensor.dog_right
 
+    def add_lettuce( self, x, y ):
+        self.lettuce_positions.add((x, y))
+        self.lettuce_distances.add_source(x, y)
+
+    def remove_lettuce( self, x, y ):
+        """ Forgets an eaten lettuce. """
+        self.lettuce_positions.remove((x, y))
+        self.lettuce_distances.remove_source(x, y)
+
+    def add_pond( self, x, y ):
+        self.water_positions.add((x, y))
+        self.water_distances.add_source(x, y)
+
     def get_current_cell( self ):
-        return self.worldmap[self.x][self.y]
+        return self.worldmap.get(self.x, self.y)
 
     def display( self ):
         """
         For debugging purpose.
         """
         print("Memory..")
-        for y in range(self.size):
-            for x in range(self.size):
-                print(self.worldmap[x][y], end=" ")
-            print()
+        print(self)
+
+    def __str__( self ):
+        return '\n'.join(' '.join(CELL_CHARS[self.worldmap.get(x, y)] for x in range(self.size)) for y in range(self.size))
+
+# The brains that save their weights, closed when the process exits
+saved_brains = weakref.WeakSet()
+
+def close_brains():
+    for brain in list(saved_brains):
+        brain.close()
+
+atexit.register(close_brains)
 
 class RationalBrain( TortoiseBrain ):
+    """
+    A Q-learning brain with a linear approximation of Q.
+    The hyperparameters below can be changed for one brain with configure().
+    """
+    ALPHA = 0.3
+    EPSILON = 0.5
+    GAMMA = 0.3
+    # Reward shaping
+    REWARDS = {
+        'remaining_lettuce': 10, # bonus while more than half of the lettuces are left
+        'eat': 50, # eat on a lettuce (minus this when not eating it)
+        'towards_lettuce': 5, # go forward to a lettuce ahead (minus this otherwise)
+        'drink_thirsty': 15, # drink when the drink level is below 20
+        'drink_half': 10, # below 50
+        'drink': 7, # below 75
+        'thirsty': -3, # drink level below 40
+        'unexplored': -8, # less than half of the map explored
+        'explored': 10, # more than half of the map explored
+        'dog_near': -15, # dog closer than 3 cells
+        'dog_close': -10, # dog within 5 cells
+        'dog_here': -20, # dog on the same cell
+    }
+    # The weights are loaded from WEIGHTS_FILE (or INITIAL_WEIGHTS, or a
+    # RESUME checkpoint) before the first episode and then kept in memory.
+    # They are saved as a new checkpoint of the run in CHECKPOINT_DIRECTORY,
+    # and in SAVE_WEIGHTS when asked, every CHECKPOINT_MOVES moves, every
+    # CHECKPOINT_EPISODES episodes and when the process exits
+    WEIGHTS_FILE = "weights.txt"
+    INITIAL_WEIGHTS = None
+    RESUME = None # checkpoint file, or directory of checkpoints
+    SAVE_WEIGHTS = None
+    CHECKPOINT_DIRECTORY = "checkpoints"
+    CHECKPOINT_MOVES = None
+    CHECKPOINT_EPISODES = 1
+    weights = None
+
+    def __init__( self ):
+        # Its own generator, so that resuming a checkpoint does not
+        # change the global one, which unseeded worlds draw from
+        self.rng = random.Random()
+
+    def configure( self, config ):
+        """
+        Overrides hyperparameters of this brain from a dict with the keys
+        alpha, epsilon, gamma, rewards (a dict of some REWARDS),
+        weights (the initial weights), weights_file, resume, save_weights,
+        checkpoint_directory, checkpoint_moves and checkpoint_episodes.
+        Giving weights without checkpoint_directory or save_weights keeps
+        the weights in memory.
+        """
+        for name in ('alpha', 'epsilon', 'gamma'):
+            if name in config:
+                setattr(self, name.upper(), float(config[name]))
+        if 'rewards' in config:
+            self.REWARDS = dict(self.REWARDS, **config['rewards'])
+        if 'weights' in config:
+            self.INITIAL_WEIGHTS = [float(weight) for weight in config['weights']]
+            self.CHECKPOINT_DIRECTORY = None
+        for name in ('weights_file', 'resume', 'save_weights', 'checkpoint_directory', 'checkpoint_moves', 'checkpoint_episodes'):
+            if name in config:
+                setattr(self, name.upper(), config[name])
+
+    def load( self ):
+        """
+        Loads the weights before the first episode. Resuming from a
+        checkpoint also restores the exploration rate, the move and
+        episode counts and the state of the random generator of the
+        brain, until seed() gives it a new one.
+        """
+        self.moves = self.episodes = 0
+        self.unsaved = False
+        self.checkpointer = None
+        if self.CHECKPOINT_DIRECTORY is not None:
+            self.checkpointer = Checkpointer(self.CHECKPOINT_DIRECTORY, type(self).__name__)
+        if self.RESUME is not None:
+            checkpoint = load_checkpoint(self.RESUME)
+            self.weights = checkpoint.weights
+            self.EPSILON = checkpoint.epsilon
+            self.moves, self.episodes = checkpoint.moves, checkpoint.episodes
+            if checkpoint.rng_state is not None:
+                self.rng.setstate(checkpoint.rng_state)
+        elif self.INITIAL_WEIGHTS is not None:
+            self.weights = list(self.INITIAL_WEIGHTS)
+        else:
+            self.weights = read_weights(self.WEIGHTS_FILE)
+        self.parameters = Parameters(self.weights)
+        if self.SAVE_WEIGHTS is not None or self.checkpointer is not None:
+            saved_brains.add(self)
+
+    def snapshot( self ):
+        """
+        Returns the configure() dict of a brain that starts from the
+        weights and hyperparameters of this one, keeping its weights in memory.
+        """
+        if self.weights is None:
+            self.load()
+        return dict(alpha = self.ALPHA, epsilon = self.EPSILON, gamma = self.GAMMA, rewards = dict(self.REWARDS),
+                    weights = list(self.weights))
+
+    def checkpoint( self ):
+        """ Saves the weights as a new checkpoint of the run and in SAVE_WEIGHTS. """
+        if self.SAVE_WEIGHTS is not None:
+            write_weights(self.SAVE_WEIGHTS, self.weights)
+        if self.checkpointer is not None:
+            self.checkpointer.save(Checkpoint(self.weights, self.epsilon, self.rng.getstate(), self.moves, self.episodes))
+        self.unsaved = False
+
+    def close( self ):
+        """ Saves what was learned since the last checkpoint. """
+        if self.weights is not None and self.unsaved:
+            self.checkpoint()
 
     def init( self, grid_size ):
-        self.state = GameState(grid_size)
-        self.alpha = float(0.3)
-        self.epsilon = float(0.5)
-        self.gamma = float(0.3)
+        if self.weights is None:
+            self.load()
+        self.state = GameState(grid_size, self.parameters)
+        self.alpha = float(self.ALPHA)
+        self.epsilon = float(self.EPSILON)
+        self.gamma = float(self.GAMMA)
         self.previous_state = None
         self.previous_action = None
 
         self.start_time = time.time()
         self.score = 0
 
+    # The features do not depend on the action: computed once per move
+    # (self.features, with the legal actions self.legalActions), they
+    # give the same Q to every action, so that the Q-values of a move
+    # are a single weighted sum
+
     def     update(self, action, prevState, reward):
-        for i in range(len(self.state.wi)):
-            difference = reward + self.gamma * self.computeValueFromQValues(self.state) - prevState.Q(prevState,action)
-            self.state.wi[i] += self.alpha * difference * prevState.f[i](prevState, action)
+        # prevState is the current state: think() updates it in place.
+        # Each weight is updated in turn with Q and U(s) of the weights
+        # updated so far
+        features = self.features
+        weights = self.state.wi
+        legalActions = self.legalActions
+        for i in range(len(weights)):
+            q = prevState.value(features)
+            # U(s): every legal action has the Q q, and there are none at the terminal state
+            U = q if q > 0 and legalActions else 0
+            difference = reward + self.gamma * U - q
+            weights[i] += self.alpha * difference * features[i]
 
     def computeValueFromQValues(self, state): # U(s)
         U = 0  # Note: if there are no legal actions, which is the case at the terminal state, you should return a value of 0.
-        for a in self.getLegalActions():
-            q = self.state.Q(state, a)
+        if self.getLegalActions():
+            q = self.state.value(self.features)
             if q > U:
                 U = q
         return U
@@ -287,30 +472,30 @@ class RationalBrain( TortoiseBrain ):
         actions = []
         action_max = legalActions[0]
         U = 0
+        q = state.value(self.features)
         for a in legalActions:
-            q = self.state.Q(state, a)
             if q == U:
                 actions.append(a)
             if q > U:
                 U = q
                 action_max = a
         if len(actions) > 1:
-            return random.choice(actions)
+            return self.rng.choice(actions)
         return action_max
 
     def flipCoin(self, p):
-        r = random.random()
+        r = self.rng.random()
         return r < p
 
     def getAction(self, state):
-        legalActions = self.getLegalActions()
+        legalActions = self.legalActions
         if len(legalActions) == 0:
             return None
 
         if self.flipCoin(self.epsilon):
             #if 'forward' in legalActions and self.state.free_ahead:
             #    legalActions.append('forward')
-            action = random.choice(legalActions)
+            action = self.rng.choice(legalActions)
         else:
             action = self.computeActionFromQValues(state, legalActions)
         return action
@@ -335,6 +520,8 @@ class RationalBrain( TortoiseBrain ):
         """
 
         self.state.update_state_from_sensor(sensor)
+        self.features = self.state.feature_vector(self.state)
+        self.legalActions = self.getLegalActions()
 
         #if (self.previous_state is not None):
         #    print(self.previous_state.wi)
@@ -348,18 +535,26 @@ class RationalBrain( TortoiseBrain ):
         action = self.getAction(self.state)
 
         if self.state.lettuce_here and action == 'eat':
-            index = self.state.lettuce_positions.index((self.state.x, self.state.y))
-            self.state.lettuce_positions.pop(index)
+            self.state.remove_lettuce(self.state.x, self.state.y)
             self.state.eaten += 1
         #self.compute_score()
 
-        self.state.display()
+        if diagnostics.enabled(diagnostics.DEBUG):
+            diagnostics.log(diagnostics.DEBUG, "Memory..\n%s", self.state)
         self.previous_action = action
-        self.state.save_weights("weights.txt")
+        self.moves += 1
+        self.unsaved = True
+        if self.CHECKPOINT_MOVES is not None and self.moves % self.CHECKPOINT_MOVES == 0:
+            self.checkpoint()
 
         #print("SCORE : ", self.score)
         return action
 
+    def end( self ):
+        self.episodes += 1
+        if self.unsaved and self.episodes % self.CHECKPOINT_EPISODES == 0:
+            self.checkpoint()
+
     def compute_score(self):
         current_time = time.time()
         elapsed_time = current_time - self.start_time
@@ -368,65 +563,57 @@ class RationalBrain( TortoiseBrain ):
 
     def reward(self, action):
         reward = 0
+        rewards = self.REWARDS
 
         # SCORE LAITUES
         if self.state.remaining_lettuce(self.state, action) > 0.5:
-            reward += 10
-        elif self.state.remaining_lettuce(self.state, action) > 0.8:
-            reward += 15
+            reward += rewards['remaining_lettuce']
 
         # MANGER LAITUES
         if self.state.lettuce_here:
-            reward += 50 if action == 'eat' else -50
+            reward += rewards['eat'] if action == 'eat' else -rewards['eat']
 
         # ALLER SUR LES LAITUES
         if self.state.lettuce_ahead:
             if action == 'forward':
-                reward += 5
+                reward += rewards['towards_lettuce']
             else :
-                reward -= 5
+                reward -= rewards['towards_lettuce']
 
         # BOIRE DE LEAU
         if self.state.water_here:
             if action == 'drink':
                 if self.state.drink_level < 20:
-                    reward += 15
+                    reward += rewards['drink_thirsty']
                 elif self.state.drink_level < 50:
-                    reward += 10
+                    reward += rewards['drink_half']
                 elif self.state.drink_level < 75:
-                    reward += 7
+                    reward += rewards['drink']
 
         # NE PAS RESTER AVEC SOIF
         if self.state.drink_level < 40:
-            reward -= 3
+            reward += rewards['thirsty']
 
         # FAVORISE L'EXPLORATION
-        explored_ratio = sum(1 for row in self.state.worldmap for cell in row if cell != '?') / (len(self.state.worldmap) ** 2)
+        explored_ratio = self.state.exploration_rate(self.state, action)
         if explored_ratio < 0.5:
-            reward -= 8
+            reward += rewards['unexplored']
         elif explored_ratio > 0.5:
-            reward += 10
-        elif explored_ratio > 0.8:
-            reward += 20
+            reward += rewards['explored']
 
-        print("exploration rate : ", explored_ratio)
 
         # PROXIMITE DU CHIEN, SANTE FAIBLE
         dog_distance = self.state.distance_manhattan(self.state.x, self.state.y, self.state.dogx, self.state.dogy)
         if dog_distance < 3 :
-            reward -= 15
+            reward += rewards['dog_near']
         elif dog_distance <= 5 :
-            reward -= 10
+            reward += rewards['dog_close']
             #if self.state.health_level < 20:
             #    reward -= 0.5
-        print("dog_distance : ", dog_distance)
         # MEME CASE QUE LE CHIEN
         if self.state.x == self.state.dogx and self.state.y == self.state.dogy:
-            reward -= 20
-
-        print("immediate reward :", reward)
-        print("action", action)
+            reward += rewards['dog_here']
 
-        print("lettuces : ", self.state.lettuce_positions)
-        print("ponds : ", self.state.water_positions)
+        diagnostics.trace("%s: reward %g, exploration rate %.3f, dog distance %d, %d lettuces and %d ponds known",
+                          action, reward, explored_ratio, dog_distance, len(self.state.lettuce_positions), len(self.state.water_positions))
         return reward
\ No newline at end of file
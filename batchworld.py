@@ -0,0 +1,267 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file batchworld.py
+#
+# @author Régis Clouard
+
+# N tortoise worlds stepped in lockstep with NumPy.
+# Each call to step() plays one tortoise move in every world,
+# followed by the dog moves due before its next move, exactly
+# as TortoiseWorld.step() would interleave them.
+
+import random
+import numpy as np
+import cells
+from cells import GROUND, LETTUCE, POND
+import tortoiseworld
+from tortoiseworld import TortoiseWorld, Sensor, generate_worldmap, stone_candidates, dog_start
+from utils import derive_seed
+
+PASSABLE = np.array(cells.PASSABLE)
+
+ACTIONS = ['eat', 'drink', 'left', 'right', 'forward', 'wait']
+EAT, DRINK, LEFT, RIGHT, FORWARD, WAIT = range(6)
+
+DIRECTION_TABLE = np.array(tortoiseworld.DIRECTIONTABLE) # North, East, South, West, None
+ROTA = np.array(tortoiseworld.ROTA)
+ROTB = np.array(tortoiseworld.ROTB)
+
+class BatchSensor():
+    """
+    The sensors of all the tortoises: the same attributes as Sensor,
+    each one holding an array with one entry per world.
+    """
+
+    def __init__( self, free_ahead, lettuce_ahead, lettuce_here, water_ahead, water_here, drink_level, health_level, dog_front, dog_right, tortoisex, tortoisey, tortoise_direction ):
+        self.free_ahead = free_ahead
+        self.lettuce_ahead = lettuce_ahead
+        self.lettuce_here = lettuce_here
+        self.water_ahead = water_ahead
+        self.water_here = water_here
+        self.drink_level = drink_level
+        self.health_level = health_level
+        self.dog_front = dog_front
+        self.dog_right = dog_right
+        self.tortoisex = tortoisex
+        self.tortoisey = tortoisey
+        self.tortoise_direction = tortoise_direction
+
+    def sensor( self, i ):
+        """
+        Returns the Sensor of world i, e.g. to drive a TortoiseBrain.
+        """
+        return Sensor(bool(self.free_ahead[i]), bool(self.lettuce_ahead[i]), bool(self.lettuce_here[i]), bool(self.water_ahead[i]), bool(self.water_here[i]), int(self.drink_level[i]), int(self.health_level[i]), int(self.dog_front[i]), int(self.dog_right[i]), int(self.tortoisex[i]), int(self.tortoisey[i]), int(self.tortoise_direction[i]))
+
+class BatchTortoiseWorld():
+    """
+    N tortoise worlds of the same size held in NumPy arrays.
+    Finished worlds are reset automatically with a new random map;
+    the outcome of their last episode is kept in the final_* arrays.
+    With a seed, maps and dogs draw from separate generators derived
+    from it, so a batch can be replayed exactly.
+    """
+    MAX_DRINK = TortoiseWorld.MAX_DRINK
+    MAX_HEALTH = TortoiseWorld.MAX_HEALTH
+    MAX_TIME = TortoiseWorld.MAX_TIME
+    DOG_PERIOD = 1.25
+    DOG_BITE = 5
+
+    def __init__( self, n, grid_size, seed = None ):
+        self.n = n
+        self.grid_size = grid_size
+        if seed is None:
+            self.rng = np.random.default_rng()
+            self.map_rng = random.Random()
+        else:
+            self.rng = np.random.default_rng(derive_seed(seed, 'dog'))
+            self.map_rng = random.Random(derive_seed(seed, 'map'))
+        self.candidates = stone_candidates(grid_size)
+        self.index = np.arange(n)
+        self.worldmap = np.zeros((n, grid_size, grid_size), dtype = np.uint8)
+        self.xpos = np.zeros(n, dtype = np.int64)
+        self.ypos = np.zeros(n, dtype = np.int64)
+        self.direction = np.zeros(n, dtype = np.int64)
+        self.drink_level = np.zeros(n, dtype = np.int64)
+        self.health = np.zeros(n, dtype = np.int64)
+        self.eaten = np.zeros(n, dtype = np.int64)
+        self.lettuce_count = np.zeros(n, dtype = np.int64)
+        self.score = np.zeros(n, dtype = np.int64)
+        self.current_time = np.zeros(n)
+        self.next_tortoise_time = np.zeros(n, dtype = np.int64)
+        self.next_dog_time = np.zeros(n)
+        self.dogx = np.zeros(n, dtype = np.int64)
+        self.dogy = np.zeros(n, dtype = np.int64)
+        self.dog_direction = np.zeros(n, dtype = np.int64)
+        self.dog_heading = np.zeros(n, dtype = np.int64) # index of the moving vector in DIRECTION_TABLE
+        self.win = np.zeros(n, dtype = bool)
+        self.done = np.zeros(n, dtype = bool)
+        self.final_score = np.zeros(n, dtype = np.int64)
+        self.final_time = np.zeros(n)
+        self.final_win = np.zeros(n, dtype = bool)
+        self.final_eaten = np.zeros(n, dtype = np.int64)
+        self.final_lettuce_count = np.zeros(n, dtype = np.int64)
+        for i in range(n):
+            self.reset(i)
+
+    def reset( self, i ):
+        """
+        Starts a new episode in world i on a new random map, in the
+        initial state of a TortoiseWorld.
+        """
+        size = self.grid_size
+        worldmap = generate_worldmap(size, self.candidates, self.map_rng)
+        self.worldmap[i] = np.frombuffer(worldmap.cells, dtype = np.uint8).reshape(size, size)
+        self.xpos[i], self.ypos[i] = 1, 1
+        self.direction[i] = 0
+        self.drink_level[i] = self.MAX_DRINK
+        self.health[i] = self.MAX_HEALTH
+        self.eaten[i] = 0
+        self.lettuce_count[i] = worldmap.counts[LETTUCE]
+        self.score[i] = 0
+        self.current_time[i] = 0
+        self.next_tortoise_time[i] = 0
+        self.next_dog_time[i] = 0
+        self.dogx[i], self.dogy[i] = dog_start(size)
+        self.dog_direction[i] = 0
+        self.dog_heading[i] = len(DIRECTION_TABLE) - 1 # None: the dog has not moved yet
+        self.win[i] = False
+        self.done[i] = False
+
+    def load_world( self, i, world ):
+        """
+        Copies the state of a TortoiseWorld of the same size into world i.
+        """
+        size = self.grid_size
+        self.worldmap[i] = np.frombuffer(world.worldmap.cells, dtype = np.uint8).reshape(size, size)
+        self.xpos[i], self.ypos[i] = world.xpos, world.ypos
+        self.direction[i] = world.direction
+        self.drink_level[i] = world.drink_level
+        self.health[i] = world.health
+        self.eaten[i] = world.eaten
+        self.lettuce_count[i] = world.lettuce_count
+        self.score[i] = world.score
+        self.current_time[i] = world.current_time
+        self.next_tortoise_time[i] = world.next_tortoise_time
+        self.next_dog_time[i] = world.next_dog_time
+        self.dogx[i], self.dogy[i] = world.dog_position
+        self.dog_direction[i] = world.dog_direction
+        self.dog_heading[i] = world.direction_table.index(tuple(world.dog_direction_vector))
+        self.win[i] = world.win
+        self.done[i] = False
+
+    def sense( self ):
+        """
+        Returns the BatchSensor of all the tortoises.
+        """
+        dx, dy = DIRECTION_TABLE[self.direction].T
+        ahead = self.worldmap[self.index, self.ypos + dy, self.xpos + dx]
+        here = self.worldmap[self.index, self.ypos, self.xpos]
+        dgx, dgy = self.dogx - self.xpos, self.dogy - self.ypos
+        rota, rotb = ROTA[self.direction], ROTB[self.direction]
+        relX = rota[:, 0] * dgx + rotb[:, 0] * dgy
+        relY = rota[:, 1] * dgx + rotb[:, 1] * dgy
+        return BatchSensor(PASSABLE[ahead], ahead == LETTUCE, here == LETTUCE, ahead == POND, here == POND, self.drink_level.copy(), self.health.copy(), relX, relY, self.xpos.copy(), self.ypos.copy(), self.direction.copy())
+
+    def step( self, actions ):
+        """
+        Plays one tortoise move in every world, the i-th tortoise doing
+        actions[i] (an index in ACTIONS), then moves the dogs up to the
+        next tortoise move. Returns the boolean array of the worlds whose
+        episode just ended; those worlds are already reset.
+        """
+        actions = np.asarray(actions)
+        index = self.index
+        self.current_time = self.next_tortoise_time.astype(float)
+        time_change = (4 - (3 * self.drink_level.astype(float) / self.MAX_DRINK)).astype(np.int64)
+        self.next_tortoise_time = self.next_tortoise_time + time_change
+        dx, dy = DIRECTION_TABLE[self.direction].T
+
+        # Sensing
+        ahead = self.worldmap[index, self.ypos + dy, self.xpos + dx]
+        here = self.worldmap[index, self.ypos, self.xpos]
+        free_ahead = PASSABLE[ahead]
+
+        # Perform actions
+        turn = (actions == LEFT) | (actions == RIGHT)
+        self.direction = np.where(actions == LEFT, (self.direction - 1) % 4, self.direction)
+        self.direction = np.where(actions == RIGHT, (self.direction + 1) % 4, self.direction)
+        forward = actions == FORWARD
+        move = forward & free_ahead
+        self.xpos = self.xpos + np.where(move, dx, 0)
+        self.ypos = self.ypos + np.where(move, dy, 0)
+        self.health = self.health - (forward & ~free_ahead)
+        eat = (actions == EAT) & (here == LETTUCE)
+        self.eaten = self.eaten + eat
+        eaten_x, eaten_y = self.xpos[eat], self.ypos[eat]
+        self.worldmap[index[eat], eaten_y, eaten_x] = GROUND
+        cost = np.where(turn | eat | (actions == WAIT), 1, 0) + np.where(forward, 2, 0)
+        self.drink_level = np.maximum(self.drink_level - cost, 0)
+        self.drink_level = np.where((actions == DRINK) & (here == POND), self.MAX_DRINK, self.drink_level)
+
+        # Update score
+        self.win = self.eaten == self.lettuce_count
+        dead = ~self.win & ((self.drink_level <= 0) | (self.health <= 0))
+        self.health = np.where(dead, 0, self.health)
+        self.score = self.eaten * 10 - (self.current_time / 10.0).astype(np.int64)
+        self.done = self.win | dead | (self.next_tortoise_time > self.MAX_TIME)
+
+        # Move the dogs until the next tortoise move
+        due = ~self.done & (self.next_dog_time < self.next_tortoise_time)
+        while due.any():
+            self.step_dogs(due)
+            due = ~self.done & (self.next_dog_time < self.next_tortoise_time)
+
+        done = self.done.copy()
+        self.final_score[done] = self.score[done]
+        self.final_time[done] = self.current_time[done]
+        self.final_win[done] = self.win[done]
+        self.final_eaten[done] = self.eaten[done]
+        self.final_lettuce_count[done] = self.lettuce_count[done]
+        for i in np.flatnonzero(done):
+            self.reset(i)
+        return done
+
+    def step_dogs( self, due ):
+        """
+        Moves one step forward the dogs of the worlds in the due mask.
+        """
+        index = self.index
+        n, size = self.n, self.grid_size
+        self.next_dog_time = np.where(due, self.next_dog_time + self.DOG_PERIOD, self.next_dog_time)
+        # If the dog steps on the tortoise it hurts
+        bite = due & (self.dogx == self.xpos) & (self.dogy == self.ypos)
+        self.health = self.health - np.where(bite, self.DOG_BITE, 0)
+        # The dog keeps moving - if possible and unless it decides to turn
+        vector = DIRECTION_TABLE[self.dog_heading]
+        nx, ny = self.dogx + vector[:, 0], self.dogy + vector[:, 1]
+        inside = (nx >= 1) & (ny >= 1) & (nx < size - 1) & (ny < size - 1)
+        cell = self.worldmap[index, np.clip(ny, 0, size - 1), np.clip(nx, 0, size - 1)]
+        keep_going, steer_random, direction, towards_x = self.dog_draws(n)
+        move = due & inside & PASSABLE[cell] & (keep_going != 0)
+        self.dogx = np.where(move, nx, self.dogx)
+        self.dogy = np.where(move, ny, self.dogy)
+        # Steer dog randomly - or towards the turtle
+        steer = due & ~move
+        right, left = self.xpos > self.dogx, self.xpos < self.dogx
+        down, up = self.ypos > self.dogy, self.ypos < self.dogy
+        x_first = np.select([right, left, down, up], [1, 3, 2, 0], 4)
+        y_first = np.select([down, up, right, left], [2, 0, 1, 3], 4)
+        chase = np.where(towards_x == 0, x_first, y_first)
+        steered = np.where(steer_random == 0, direction, chase)
+        self.dog_direction = np.where(steer, steered, self.dog_direction)
+        self.dog_heading = np.where(steer, steered, self.dog_heading)
+
+    def dog_draws( self, n ):
+        """
+        Draws the random numbers a dog may use in a step:
+        whether it keeps going, whether it steers randomly,
+        the random direction, and which axis it chases first.
+        """
+        return self.rng.integers(0, 4, n), self.rng.integers(0, 3, n), self.rng.integers(0, 4, n), self.rng.integers(0, 2, n)
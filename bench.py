@@ -0,0 +1,415 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file bench.py
+#
+# @author Régis Clouard
+
+# Benchmarks of the simulator and of the agents, with fixed seeds.
+# The results can be saved as JSON and compared with a baseline:
+#
+# > python bench.py -o baseline.json
+# > python bench.py --baseline baseline.json
+
+import sys
+import os
+import json
+import time
+import random
+import shutil
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import contextlib
+import agents
+from tortoiseworld import TortoiseWorld, generate_worldmap, stone_candidates, run_episode
+from cells import DistanceField, LETTUCE, GROUND, STONE
+from utils import TimeBudget, derive_seed
+from registry import load_agent
+
+BRAINS = ['RandomBrain', 'ReflexBrain', 'RationalBrain']
+MAP_SIZES = [10, 15, 30, 60]
+DISTANCE_SIZES = [15, 30, 60, 120]
+# Import time of the command line tools and the most it may be (ms),
+# and the modules they must leave to the code that needs them
+IMPORT_BUDGETS = {'tortoise': 50.0, 'runs': 50.0}
+HEAVY_MODULES = ('tkinter', 'agents', 'multiprocessing', 'numpy')
+# Memory allocated by a step of the game cycle, freed or not (bytes)
+ALLOCATION_BUDGET = 96
+
+class Benchmark():
+    """
+    The measures of a benchmark run, by name: value, unit and
+    whether higher is better.
+    """
+
+    def __init__( self, only = None ):
+        self.only = only
+        self.results = {}
+
+    def wanted( self, name ):
+        return self.only is None or self.only in name
+
+    def add( self, name, value, unit, higher_is_better, budget = None ):
+        self.results[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        if budget is not None:
+            self.results[name]['budget'] = budget
+        print("   %-28s %12.3f %s" % (name, value, unit))
+
+    def over_budget( self ):
+        """ Returns the names of the measures that are worse than their budget. """
+        over = []
+        for name, result in sorted(self.results.items()):
+            budget = result.get('budget')
+            if budget is not None and (result['value'] < budget if result['higher_is_better'] else result['value'] > budget):
+                over.append(name)
+        return over
+
+@contextlib.contextmanager
+def scratch_directory():
+    """
+    Runs in a temporary directory holding a copy of weights.txt, so that
+    learning agents start from the same weights on every run and leave
+    the weights of the project untouched. The output of the agents is
+    discarded.
+    """
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp()
+    try:
+        if os.path.exists('weights.txt'):
+            shutil.copy('weights.txt', directory)
+        os.chdir(directory)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+def best_time( function, repeat ):
+    """ Returns the best duration of repeat calls to function. """
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_episodes( bench, width, episodes, seed, repeat ):
+    """ Episodes and tortoise moves per second, for each brain. """
+    for name in BRAINS:
+        if not bench.wanted('episodes/' + name):
+            continue
+        brain_class = getattr(agents, name)
+        moves = [0]
+        def play():
+            moves[0] = 0
+            brain = brain_class()
+            with scratch_directory():
+                for i in range(episodes):
+                    budget = TimeBudget(None, None)
+                    run_episode(width, brain, budget, derive_seed(seed, i))
+                    moves[0] += budget.moves
+        duration = best_time(play, repeat)
+        bench.add('episodes/' + name, episodes / duration, 'episodes/s', True)
+        bench.add('steps/' + name, moves[0] / duration, 'moves/s', True)
+
+def bench_maps( bench, seed, repeat ):
+    """ Time to generate a random map, for each grid size. """
+    for size in MAP_SIZES:
+        if not bench.wanted('mapgen/%d' % size):
+            continue
+        number = max(2, 2000 // size)
+        candidates = stone_candidates(size)
+        def generate():
+            rng = random.Random(derive_seed(seed, 'map', size))
+            for i in range(number):
+                generate_worldmap(size, candidates, rng)
+        bench.add('mapgen/%d' % size, 1000 * best_time(generate, repeat) / number, 'ms/map', False)
+
+def bench_features( bench, width, seed, repeat ):
+    """ Cost of the Q-value and of each feature of the RationalBrain state. """
+    if not bench.wanted('features/'):
+        return
+    brain = agents.RationalBrain()
+    with open('weights.txt') as file:
+        brain.configure({'weights': [float(line) for line in file if line.strip()]}) # nothing saved
+    with scratch_directory():
+        brain.seed(derive_seed(seed, 'agent'))
+        brain.init(width)
+        world = TortoiseWorld(width, brain, seed = seed)
+        for i in range(200):
+            if world.is_over():
+                break
+            world.step()
+    state = brain.state
+    calls = 2000
+    actions = ['eat', 'drink', 'left', 'right', 'forward', 'wait']
+    def q_values():
+        for i in range(calls // len(actions)):
+            for action in actions:
+                state.Q(state, action)
+    bench.add('features/Q', 1e6 * best_time(q_values, repeat) / (calls // len(actions) * len(actions)), 'us/call', False)
+    features = state.feature_vector(state)
+    def values():
+        for i in range(calls):
+            state.value(features)
+    bench.add('features/value', 1e6 * best_time(values, repeat) / calls, 'us/call', False)
+    for feature in state.FEATURES:
+        def evaluate():
+            for i in range(calls):
+                feature(state, state, 'forward')
+        bench.add('features/' + feature.__name__, 1e6 * best_time(evaluate, repeat) / calls, 'us/call', False)
+
+def bench_distances( bench, seed, repeat ):
+    """
+    Cost of an update of a distance field to the lettuces, for each grid
+    size: computed again from scratch, or incrementally when a stone is
+    found and when a lettuce is eaten.
+    """
+    for size in DISTANCE_SIZES:
+        if not any(bench.wanted('distances/%s/%d' % (kind, size)) for kind in ('full', 'block', 'remove')):
+            continue
+        rng = random.Random(derive_seed(seed, 'distances', size))
+        worldmap = generate_worldmap(size, stone_candidates(size), rng)
+        field = DistanceField(worldmap)
+        lettuces = [(x, y) for y in range(size) for x in range(size) if worldmap.get(x, y) == LETTUCE]
+        grounds = [(x, y) for y in range(size) for x in range(size) if worldmap.get(x, y) == GROUND]
+        for x, y in lettuces:
+            field.add_source(x, y)
+        number = min(50, len(grounds), len(lettuces))
+        stones = rng.sample(grounds, number)
+        eaten = rng.sample(lettuces, number)
+        bench.add('distances/full/%d' % size, 1e6 * best_time(field.recompute, repeat), 'us/update', False)
+        # Every run updates a fresh copy, since the updates are not undone
+        def incremental( update, cells ):
+            best = float('inf')
+            for i in range(repeat):
+                grid = worldmap.copy()
+                copy = field.copy(grid)
+                start = time.perf_counter()
+                for x, y in cells:
+                    update(grid, copy, x, y)
+                best = min(best, time.perf_counter() - start)
+            return 1e6 * best / number
+        def block( grid, copy, x, y ):
+            grid.set(x, y, STONE)
+            copy.block(x, y)
+        bench.add('distances/block/%d' % size, incremental(block, stones), 'us/update', False)
+        bench.add('distances/remove/%d' % size, incremental(lambda grid, copy, x, y: copy.remove_source(x, y), eaten), 'us/update', False)
+
+def bench_memory( bench, width, seed ):
+    """ Peak memory allocated during an episode, for each brain. """
+    for name in BRAINS:
+        if not bench.wanted('memory/' + name):
+            continue
+        brain = getattr(agents, name)()
+        with scratch_directory():
+            tracemalloc.start()
+            run_episode(width, brain, TimeBudget(None, None), derive_seed(seed, 0))
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        bench.add('memory/' + name, peak / 1024.0, 'KiB', False)
+
+class FixedBrain():
+    """ A brain that allocates nothing, cycling through fixed actions. """
+    ACTIONS = ('forward', 'left', 'forward', 'right', 'forward', 'eat', 'drink', 'wait')
+
+    def __init__( self ):
+        self.k = 0
+
+    def init( self, grid_size ):
+        pass
+
+    def think( self, sensor ):
+        self.k = (self.k + 1) & 7
+        return self.ACTIONS[self.k]
+
+def bench_spec_agent( bench, width, episodes, seed, repeat ):
+    """
+    Episodes per second of FixedBrain loaded by its module:Class spec,
+    as an agent of another module would be: it only has init() and
+    think(), which is all that a seeded episode may ask of it.
+    """
+    if not bench.wanted('episodes/spec'):
+        return
+    brain_class = load_agent('bench:FixedBrain')
+    def play():
+        brain = brain_class()
+        for i in range(episodes):
+            run_episode(width, brain, TimeBudget(None, None), derive_seed(seed, i))
+    bench.add('episodes/spec', episodes / best_time(play, repeat), 'episodes/s', True)
+
+def bench_allocations( bench, seed ):
+    """
+    Memory allocated by the game cycle per step, even if freed within
+    the step: the peak of the traced memory during each step over the
+    memory in use before it, averaged over the steps of a tortoise that
+    never dies. What remains is the few integers and the random draws
+    of the dog; an object built per move goes over ALLOCATION_BUDGET.
+    """
+    if not bench.wanted('allocations/step'):
+        return
+    world = TortoiseWorld(30, FixedBrain(), budget = TimeBudget(None, None), seed = seed)
+    world.MAX_TIME = float('inf')
+    for i in range(1000):
+        world.step()
+    steps = 20000
+    allocated = 0
+    tracemalloc.start()
+    try:
+        for i in range(steps):
+            # Small levels, as in a real episode
+            world.drink_level, world.health, world.eaten = world.MAX_DRINK, world.MAX_HEALTH, 0
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            world.step()
+            allocated += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    bench.add('allocations/step', float(allocated) / steps, 'bytes/step', False, ALLOCATION_BUDGET)
+
+def bench_imports( bench, repeat ):
+    """
+    Time to import the modules of the command line tools, which is paid
+    by every run and every worker process: the cumulative time of the
+    module given by python -X importtime, all measured in the same new
+    interpreter, so its own startup is left out. Importing them must not
+    load any of HEAVY_MODULES, whose number is the other measure.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    environment = dict(os.environ)
+    environment.pop('PYTHONDONTWRITEBYTECODE', None) # measure the cached bytecode, as installed
+    check = 'import sys, %s; print(" ".join(name for name in %r if name in sys.modules))'
+    for module in sorted(IMPORT_BUDGETS):
+        if not bench.wanted('import/' + module):
+            continue
+        best, heavy = float('inf'), []
+        for i in range(max(repeat, 5) + 1):
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', check % (module, HEAVY_MODULES)],
+                                     cwd = directory, env = environment, capture_output = True, text = True, check = True)
+            heavy = process.stdout.split()
+            for line in process.stderr.splitlines():
+                fields = line.split('|')
+                if len(fields) == 3 and fields[2].strip() == module and not fields[2][1:].startswith(' '):
+                    if i > 0: # the first run compiles the bytecode
+                        best = min(best, int(fields[1]) / 1000.0)
+        bench.add('import/' + module, best, 'ms', False, IMPORT_BUDGETS[module])
+        if heavy:
+            print("   %s loads %s" % (module, ', '.join(heavy)))
+        bench.add('import/%s/heavy' % module, len(heavy), 'modules', False, 0)
+
+def compare( results, baseline, threshold ):
+    """
+    Prints the changes from the baseline results and returns the names
+    of the benchmarks that got worse by more than threshold (a ratio).
+    """
+    regressions = []
+    print("\nComparison with the baseline (threshold %.0f%%)" % (100 * threshold))
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], results[name]['value']
+        if old == 0:
+            change = 0.0 if new == 0 else float('inf')
+        else:
+            change = (new - old) / old
+        worse = -change if results[name]['higher_is_better'] else change
+        flag = ''
+        if worse > threshold:
+            regressions.append(name)
+            flag = 'REGRESSION'
+        elif worse < -threshold:
+            flag = 'improvement'
+        print("   %-28s %12.3f -> %12.3f %+7.1f%%  %s" % (name, old, new, 100 * change, flag))
+    return regressions
+
+def run_benchmarks( width, episodes, seed, repeat, only, output, baseline, threshold ):
+    """ The real main. Returns the exit status. """
+    bench = Benchmark(only)
+    print("Benchmarks (seed %d, best of %d)" % (seed, repeat))
+    bench_episodes(bench, width, episodes, seed, repeat)
+    bench_maps(bench, seed, repeat)
+    bench_features(bench, width, seed, repeat)
+    bench_distances(bench, seed, repeat)
+    bench_memory(bench, width, seed)
+    bench_spec_agent(bench, width, episodes, seed, repeat)
+    bench_allocations(bench, seed)
+    bench_imports(bench, repeat)
+    report = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                       'width': width, 'episodes': episodes, 'seed': seed, 'repeat': repeat},
+              'results': bench.results}
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent = 2, sort_keys = True)
+    status = 0
+    over = bench.over_budget()
+    if over:
+        print("\n%d over budget: %s" % (len(over), ', '.join(over)))
+        status = 1
+    if baseline is not None:
+        with open(baseline) as file:
+            regressions = compare(bench.results, json.load(file)['results'], threshold)
+        if regressions:
+            print("\n%d regressions: %s" % (len(regressions), ', '.join(regressions)))
+            status = 1
+    return status
+
+def default( str ):
+    return str + ' [Default: %default]'
+
+def read_command( argv ):
+    """ Processes the command used to run the benchmarks from the command line. """
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python bench.py <options>
+    EXAMPLES:   python bench.py -o baseline.json
+                    - run all the benchmarks and save the results
+                python bench.py --baseline baseline.json -k episodes
+                    - compare the episode benchmarks with the saved ones
+    """
+    parser = OptionParser(usageStr)
+
+    parser.add_option('-w', '--width', dest = 'width', type = 'int',
+                      help = default('World width'), default = 15)
+    parser.add_option('-e', '--episodes', dest = 'episodes', type = 'int',
+                      help = default('Episodes played per brain'), default = 20)
+    parser.add_option('-r', '--random-seed', dest = 'seed', type = 'int',
+                      help = default('Random seed'), default = 1)
+    parser.add_option('--repeat', dest = 'repeat', type = 'int',
+                      help = default('Repetitions of each measure, the best one is kept'), default = 3)
+    parser.add_option('-k', '--only', dest = 'only', metavar = 'NAME',
+                      help = 'Only run the benchmarks whose name contains NAME', default = None)
+    parser.add_option('-o', '--output', dest = 'output', metavar = 'FILE',
+                      help = 'Save the results as JSON in FILE', default = None)
+    parser.add_option('--baseline', dest = 'baseline', metavar = 'FILE',
+                      help = 'Compare with the results saved in FILE', default = None)
+    parser.add_option('--threshold', dest = 'threshold', type = 'float',
+                      help = default('Relative change reported as a regression'), default = 0.10)
+
+    options, otherjunk = parser.parse_args(argv)
+
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return dict(width = options.width, episodes = options.episodes, seed = options.seed, repeat = options.repeat,
+                only = options.only, output = options.output, baseline = options.baseline, threshold = options.threshold)
+
+if __name__ == '__main__':
+    """ The main function called when bench.py is run
+    from the command line:
+
+    > python bench.py
+
+    See the usage string for more details.
+
+    > python bench.py --help
+    > python bench.py -h """
+    args = read_command(sys.argv[1:])
+    sys.exit(run_benchmarks(**args))
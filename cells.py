@@ -0,0 +1,200 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file cells.py
+#
+# @author Régis Clouard
+
+# Cell types shared by the tortoise world and the agents,
+# the compact grid used to store maps and the structures
+# the agents use to query their map.
+
+import heapq
+import array
+
+# Cell codes
+GROUND = 0
+WALL = 1
+STONE = 2
+LETTUCE = 3
+POND = 4
+UNKNOWN = 5 # only in the agent memory
+
+CELL_TYPES = 6
+CELL_NAMES = ('ground', 'wall', 'stone', 'lettuce', 'pond', 'unknown') # also the image names
+CELL_CHARS = ('.', 'X', 's', 'l', 'p', '?')
+
+# Lookup tables indexed by cell code
+PASSABLE = (True, False, False, True, True, False)
+IS_LETTUCE = (False, False, False, True, False, False)
+IS_POND = (False, False, False, False, True, False)
+PASSABLE_OR_UNKNOWN = (True, False, False, True, True, True) # in the agent memory
+
+class Grid():
+    """
+    A square map of cells stored as one byte per cell, row by row.
+    The number of cells of each type is kept up to date on every change.
+    """
+    __slots__ = ('size', 'cells', 'counts')
+
+    def __init__( self, size, border = WALL, inside = GROUND ):
+        self.size = size
+        self.cells = bytearray([border]) * (size * size)
+        for y in range(1, size - 1):
+            self.cells[y * size + 1:(y + 1) * size - 1] = bytes([inside]) * (size - 2)
+        self.counts = [0] * CELL_TYPES
+        if size > 2:
+            self.counts[inside] = (size - 2) ** 2
+        self.counts[border] += size * size - max(size - 2, 0) ** 2
+
+    def get( self, x, y ):
+        return self.cells[y * self.size + x]
+
+    def set( self, x, y, cell ):
+        i = y * self.size + x
+        self.counts[self.cells[i]] -= 1
+        self.counts[cell] += 1
+        self.cells[i] = cell
+
+    def load( self, data ):
+        """
+        Replaces all the cells by the size * size bytes of data.
+        """
+        self.cells[:] = data
+        self.counts = [self.cells.count(cell) for cell in range(CELL_TYPES)]
+
+    def copy( self ):
+        grid = Grid.__new__(Grid)
+        grid.size = self.size
+        grid.cells = bytearray(self.cells)
+        grid.counts = list(self.counts)
+        return grid
+
+    def __deepcopy__( self, memo ):
+        return self.copy()
+
+UNREACHABLE = 1 << 30
+
+class DistanceField():
+    """
+    The length of the shortest path from every cell of a grid to the
+    nearest of a set of source cells, by steps to the 4 neighbors through
+    passable cells (PASSABLE_OR_UNKNOWN by default: the agent assumes
+    it can walk where it has not looked yet). Cells with no path are
+    UNREACHABLE. The border of the grid must not be passable.
+
+    The distances are kept up to date as the sources or the grid change,
+    only revisiting the cells whose distance changes: a new source lowers
+    the distances around it, while a removed source or a cell that became
+    impassable raises those of the cells whose shortest paths went
+    through it, which are then searched again from their neighbors.
+    """
+
+    def __init__( self, grid, passable = PASSABLE_OR_UNKNOWN ):
+        self.grid = grid
+        self.size = grid.size
+        self.passable = passable
+        self.sources = set() # cell indexes
+        self.distances = array.array('i', [UNREACHABLE]) * (self.size * self.size)
+        self.steps = (-1, 1, -self.size, self.size)
+
+    def distance( self, x, y ):
+        return self.distances[y * self.size + x]
+
+    def add_source( self, x, y ):
+        i = y * self.size + x
+        if i not in self.sources:
+            self.sources.add(i)
+            if self.passable[self.grid.cells[i]]:
+                self.distances[i] = 0
+                self.lower([i])
+
+    def remove_source( self, x, y ):
+        i = y * self.size + x
+        if i in self.sources:
+            self.sources.remove(i)
+            self.invalidate(i)
+
+    def block( self, x, y ):
+        """ Updates the distances once the cell (x, y) of the grid became impassable. """
+        self.invalidate(y * self.size + x)
+
+    def lower( self, queue ):
+        """ Propagates the distances of the cells of queue, in increasing order. """
+        distances, cells, passable, steps = self.distances, self.grid.cells, self.passable, self.steps
+        for i in queue:
+            d = distances[i] + 1
+            for step in steps:
+                j = i + step
+                if d < distances[j] and passable[cells[j]]:
+                    distances[j] = d
+                    queue.append(j)
+
+    def invalidate( self, i ):
+        """
+        Recomputes the distances that may have increased because the cell i
+        is no longer a source or no longer passable: those of the cells
+        whose distance grows by one along a path from i.
+        """
+        distances, cells, passable, steps = self.distances, self.grid.cells, self.passable, self.steps
+        if distances[i] == UNREACHABLE:
+            return
+        affected = [i]
+        seen = {i}
+        for k in affected:
+            d = distances[k] + 1
+            for step in steps:
+                j = k + step
+                if distances[j] == d and j not in seen:
+                    seen.add(j)
+                    affected.append(j)
+        for k in affected:
+            distances[k] = UNREACHABLE
+        # The affected cells get their distance back from their other
+        # neighbors, the nearest first
+        seeds = []
+        for k in affected:
+            if not passable[cells[k]]:
+                continue
+            if k in self.sources:
+                d = 0
+            else:
+                d = min([distances[k + step] for step in steps]) + 1
+            if d < UNREACHABLE:
+                distances[k] = d
+                seeds.append((d, k))
+        heapq.heapify(seeds)
+        while seeds:
+            d, k = heapq.heappop(seeds)
+            if d != distances[k]:
+                continue
+            for step in steps:
+                j = k + step
+                if d + 1 < distances[j] and passable[cells[j]]:
+                    distances[j] = d + 1
+                    heapq.heappush(seeds, (d + 1, j))
+
+    def recompute( self ):
+        """ Computes all the distances again, with a breadth first search from the sources. """
+        self.distances = array.array('i', [UNREACHABLE]) * (self.size * self.size)
+        queue = [i for i in sorted(self.sources) if self.passable[self.grid.cells[i]]]
+        for i in queue:
+            self.distances[i] = 0
+        self.lower(queue)
+
+    def copy( self, grid ):
+        """ Returns a copy of the field over grid, a copy of its grid. """
+        field = DistanceField.__new__(DistanceField)
+        field.grid = grid
+        field.size = self.size
+        field.passable = self.passable
+        field.sources = set(self.sources)
+        field.distances = array.array('i', self.distances)
+        field.steps = self.steps
+        return field
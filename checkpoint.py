@@ -0,0 +1,140 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file checkpoint.py
+#
+# @author Régis Clouard
+
+# Checkpoints of a learning agent: its weights, exploration rate, random
+# generator state and move and episode counts, in a compact binary file.
+#
+# Every file is written atomically: to a temporary file of the same
+# directory, then renamed over the target, so that a crash leaves either
+# the old or the new file, never a truncated one.
+#
+# A Checkpointer numbers the checkpoints of a run, <run>-<version>.tckp,
+# so that parallel runs sharing a directory never overwrite each other.
+
+import itertools
+import os
+import struct
+import time
+
+MAGIC = b'TCKP'
+VERSION = 1
+# magic, version, flags, number of weights, moves, episodes, epsilon
+HEADER_FORMAT = struct.Struct('<4s 2H I 2Q d')
+HAS_RNG = 1
+# Mersenne Twister state of random.getstate(): version, 625 words, gauss_next
+RNG_FORMAT = struct.Struct('<B 625I ? d')
+EXTENSION = '.tckp'
+KEEP = 5 # checkpoints kept per run
+run_numbers = itertools.count(1) # of the runs of this process
+
+def write_atomically( filename, data ):
+    """ Replaces the content of filename by data (bytes) atomically. """
+    temporary = '%s.%d.tmp' % (filename, os.getpid())
+    fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(temporary, filename)
+
+def read_weights( filename ):
+    """ Returns the weights of a text file, one per line. """
+    with open(filename, 'r') as file:
+        return [float(line.strip()) for line in file if line.strip()]
+
+def write_weights( filename, weights ):
+    """ Saves weights as text, one per line, atomically. """
+    write_atomically(filename, ''.join(f"{weight}\n" for weight in weights).encode())
+
+class Checkpoint():
+    """
+    The state of a learning agent. rng_state is the result of
+    random.getstate(), or None.
+    """
+
+    def __init__( self, weights, epsilon, rng_state = None, moves = 0, episodes = 0 ):
+        self.weights = list(weights)
+        self.epsilon = epsilon
+        self.rng_state = rng_state
+        self.moves = moves
+        self.episodes = episodes
+
+    def to_bytes( self ):
+        flags = HAS_RNG if self.rng_state is not None else 0
+        data = [HEADER_FORMAT.pack(MAGIC, VERSION, flags, len(self.weights), self.moves, self.episodes, self.epsilon),
+                struct.pack('<%dd' % len(self.weights), *self.weights)]
+        if self.rng_state is not None:
+            version, words, gauss_next = self.rng_state
+            data.append(RNG_FORMAT.pack(version, *words, gauss_next is not None, gauss_next or 0.0))
+        return b''.join(data)
+
+    @staticmethod
+    def from_bytes( data ):
+        magic, version, flags, count, moves, episodes, epsilon = HEADER_FORMAT.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise Exception('Not a checkpoint of version %d' % VERSION)
+        offset = HEADER_FORMAT.size
+        weights = struct.unpack_from('<%dd' % count, data, offset)
+        offset += 8 * count
+        rng_state = None
+        if flags & HAS_RNG:
+            values = RNG_FORMAT.unpack_from(data, offset)
+            rng_state = (values[0], values[1:626], values[627] if values[626] else None)
+        return Checkpoint(weights, epsilon, rng_state, moves, episodes)
+
+def save_checkpoint( filename, checkpoint ):
+    write_atomically(filename, checkpoint.to_bytes())
+
+def load_checkpoint( path ):
+    """ Loads a checkpoint file, or the latest checkpoint of a directory. """
+    if os.path.isdir(path):
+        filenames = [os.path.join(path, name) for name in os.listdir(path) if name.endswith(EXTENSION)]
+        if not filenames:
+            raise Exception('No checkpoint in ' + path)
+        path = max(filenames, key = os.path.getmtime)
+    with open(path, 'rb') as file:
+        return Checkpoint.from_bytes(file.read())
+
+def checkpoint_config( options ):
+    """ Returns the configure() dict of the --checkpoint, --checkpoint-every, --resume and --save-weights options given. """
+    config = dict(checkpoint_directory = options.checkpoint, checkpoint_moves = options.checkpoint_moves, resume = options.resume,
+                  save_weights = options.save_weights)
+    return dict((name, value) for name, value in config.items() if value is not None)
+
+class Checkpointer():
+    """
+    Saves the successive checkpoints of a run in a directory, keeping
+    the last keep ones. The run name defaults to the given prefix,
+    the start time, the process id and the number of the run in the
+    process.
+    """
+
+    def __init__( self, directory, prefix = 'run', run = None, keep = KEEP ):
+        self.directory = directory
+        self.run = run or '%s-%s-%d-%d' % (prefix, time.strftime('%Y%m%d-%H%M%S'), os.getpid(), next(run_numbers))
+        self.keep = keep
+        self.version = 0
+
+    def filename( self, version ):
+        return os.path.join(self.directory, '%s-%06d%s' % (self.run, version, EXTENSION))
+
+    def save( self, checkpoint ):
+        """ Saves the checkpoint as the next version and returns its file name. """
+        self.version += 1
+        os.makedirs(self.directory, exist_ok = True)
+        filename = self.filename(self.version)
+        save_checkpoint(filename, checkpoint)
+        if self.version > self.keep and os.path.exists(self.filename(self.version - self.keep)):
+            os.remove(self.filename(self.version - self.keep))
+        return filename
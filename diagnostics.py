@@ -0,0 +1,90 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file diagnostics.py
+#
+# @author Régis Clouard
+
+# Leveled messages and a trace of the last moves, shared by the world
+# and the brains.
+#
+# log() writes a message on the standard error when its level is at
+# least the current level (WARNING by default, so an episode is silent).
+# trace() records a per-move diagnostic in a ring buffer of the last
+# TRACE_SIZE records, which is only written out by dump(): when an
+# episode fails, or on request (tortoise.py --trace FILE).
+#
+# Messages are %-format strings and their arguments; they are only
+# formatted when written, so a disabled diagnostic costs a call.
+
+import sys
+
+ERROR = 40
+WARNING = 30
+INFO = 20
+DEBUG = 10
+LEVELS = {'error': ERROR, 'warning': WARNING, 'info': INFO, 'debug': DEBUG}
+LEVEL_NAMES = dict((value, name) for name, value in LEVELS.items())
+TRACE_SIZE = 512 # records
+
+level = WARNING
+
+def set_level( new_level ):
+    """ Sets the level, as a number or a name of LEVELS. """
+    global level
+    level = LEVELS[new_level] if new_level in LEVELS else int(new_level)
+
+def enabled( message_level ):
+    """ Returns true if messages of this level are written, e.g. to skip computing their arguments. """
+    return message_level >= level
+
+def log( message_level, message, *args ):
+    if message_level >= level:
+        sys.stderr.write('%s: %s\n' % (LEVEL_NAMES.get(message_level, message_level), message % args if args else message))
+
+class TraceBuffer():
+    """
+    The last size records of (message, arguments). The arguments are
+    kept as they are and must not change afterwards: record numbers,
+    strings or tuples, not lists.
+    """
+
+    def __init__( self, size = TRACE_SIZE ):
+        self.size = size
+        self.clear()
+
+    def clear( self ):
+        self.records = [None] * self.size
+        self.count = 0
+
+    def add( self, message, args ):
+        self.records[self.count % self.size] = (message, args)
+        self.count += 1
+
+    def lines( self ):
+        """ Returns the records as text, the oldest first. """
+        first = max(0, self.count - self.size)
+        lines = []
+        for k in range(first, self.count):
+            message, args = self.records[k % self.size]
+            lines.append('%6d  %s' % (k, message % args if args else message))
+        return lines
+
+trace_buffer = TraceBuffer()
+
+def trace( message, *args ):
+    trace_buffer.add(message, args)
+
+def dump( file = None, title = 'Trace' ):
+    """ Writes the trace records in file (the standard error by default). """
+    file = file or sys.stderr
+    file.write('%s: last %d of %d records\n' % (title, min(trace_buffer.count, trace_buffer.size), trace_buffer.count))
+    for line in trace_buffer.lines():
+        file.write(line + '\n')
+    file.flush()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file instrument.py
+#
+# @author Régis Clouard
+
+# Opt-in timing of the phases of an episode.
+# Instrumentation.install() replaces the instrumented methods by timed
+# wrappers and uninstall() puts the originals back, so nothing is paid
+# when it is not installed.
+
+import sys
+import json
+import time
+
+WORLD_METHODS = ('step_tortoise', 'perform', 'step_dog')
+FRAME_METHODS = ('frame', 'draw')
+BRAIN_METHODS = ('think', 'update', 'reward')
+IO_METHODS = ('load_weights', 'save_weights', 'checkpoint', 'display') # of any class of the brain module
+BUCKETS = 256 # histogram buckets, 4 per power of 2 of the duration in ns (see bucket())
+
+def bucket( d ):
+    """
+    Returns the histogram bucket of a duration d (ns): d itself below 4,
+    otherwise 4 * (n - 1) + the 2 bits after the leading one, n being
+    the number of bits of d.
+    """
+    n = d.bit_length()
+    if n < 3:
+        return d
+    return 4 * (n - 1) + (d >> (n - 3)) - 4
+
+def bucket_bound( k ):
+    """ Returns the largest duration of bucket k. """
+    if k < 8:
+        return min(k, 3) # buckets 4 to 7 are unused
+    n = k // 4 + 1
+    return ((k % 4 + 5) << (n - 3)) - 1
+
+class Phase():
+    """
+    Call count, durations and latency histogram of one method.
+    Self time excludes the time spent in instrumented methods called by it.
+    """
+
+    def __init__( self, name ):
+        self.name = name
+        self.reset()
+
+    def reset( self ):
+        self.calls = 0
+        self.total = 0 # ns
+        self.self_time = 0 # ns
+        self.max = 0 # ns
+        self.histogram = [0] * BUCKETS
+
+    def add( self, elapsed, self_time ):
+        self.calls += 1
+        self.total += elapsed
+        self.self_time += self_time
+        if elapsed > self.max:
+            self.max = elapsed
+        self.histogram[bucket(elapsed)] += 1
+
+    def merge( self, data ):
+        self.calls += data['calls']
+        self.total += data['total_ns']
+        self.self_time += data['self_ns']
+        self.max = max(self.max, data['max_ns'])
+        for k, count in enumerate(data['histogram']):
+            self.histogram[k] += count
+
+    def percentile( self, p ):
+        """ Returns an upper bound of the p-th percentile in ns. """
+        rank = p / 100.0 * self.calls
+        seen = 0
+        for k, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return min(bucket_bound(k), self.max)
+        return self.max
+
+    def to_dict( self ):
+        return {'calls': self.calls, 'total_ns': self.total, 'self_ns': self.self_time,
+                'max_ns': self.max, 'histogram': list(self.histogram)}
+
+class Instrumentation():
+    """
+    Times the instrumented methods in Phases, by name.
+    """
+
+    def __init__( self ):
+        self.phases = {}
+        self.children = [] # time spent in the instrumented calls of each running call
+        self.installed = []
+
+    def wrap( self, owner, name, phase_name = None ):
+        """
+        Replaces the method name of the class owner by a timed wrapper.
+        """
+        if any(o is owner and n == name for o, n, original in self.installed):
+            return
+        original = owner.__dict__.get(name)
+        method = getattr(owner, name)
+        phase_name = phase_name or owner.__name__ + '.' + name
+        phase = self.phases.setdefault(phase_name, Phase(phase_name))
+        children = self.children
+        clock = time.perf_counter_ns
+
+        def timed( *args, **kwargs ):
+            children.append(0)
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                inner = children.pop()
+                if children:
+                    children[-1] += elapsed
+                phase.add(elapsed, elapsed - inner)
+        timed.__name__ = name
+        self.installed.append((owner, name, original))
+        setattr(owner, name, timed)
+
+    def install( self, brain_classes = (), frame_class = None ):
+        """
+        Instruments the game cycle, the given brain classes (and the
+        file and console output of their module) and the frame class.
+        Must be called before the worlds are created, since a world
+        binds the think method of its brain.
+        """
+        from tortoiseworld import TortoiseWorld
+        for name in WORLD_METHODS:
+            self.wrap(TortoiseWorld, name)
+        if frame_class is not None:
+            for name in FRAME_METHODS:
+                self.wrap(frame_class, name)
+        for brain_class in brain_classes:
+            for name in BRAIN_METHODS:
+                if hasattr(brain_class, name):
+                    self.wrap(brain_class, name, brain_class.__name__ + '.' + name)
+            module = sys.modules[brain_class.__module__]
+            for owner in list(vars(module).values()):
+                if isinstance(owner, type) and owner.__module__ == module.__name__:
+                    for name in IO_METHODS:
+                        if name in owner.__dict__:
+                            self.wrap(owner, name)
+
+    def uninstall( self ):
+        """ Puts the original methods back. """
+        for owner, name, original in reversed(self.installed):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.installed = []
+
+    def collect( self ):
+        """ Returns the measures as a dict and starts new ones. """
+        data = dict((name, phase.to_dict()) for name, phase in self.phases.items() if phase.calls)
+        for phase in self.phases.values():
+            phase.reset()
+        return data
+
+    def merge( self, data ):
+        """ Adds measures returned by collect(), e.g. in another process. """
+        for name, phase_data in data.items():
+            self.phases.setdefault(name, Phase(name)).merge(phase_data)
+
+    def table( self ):
+        """ Returns the measures as a text table, the most expensive first. """
+        lines = ["%-34s %9s %10s %10s %9s %9s %9s %9s" % ('Phase', 'Calls', 'Total ms', 'Self ms', 'Mean us', 'p50 us', 'p99 us', 'Max us')]
+        phases = sorted((phase for phase in self.phases.values() if phase.calls), key = lambda phase: -phase.self_time)
+        for phase in phases:
+            lines.append("%-34s %9d %10.1f %10.1f %9.2f %9.2f %9.2f %9.2f" % (
+                phase.name, phase.calls, phase.total / 1e6, phase.self_time / 1e6, phase.total / 1e3 / phase.calls,
+                phase.percentile(50) / 1e3, phase.percentile(99) / 1e3, phase.max / 1e3))
+        return '\n'.join(lines)
+
+    def save( self, filename ):
+        """ Saves the measures as JSON, with the histogram buckets as in bucket(). """
+        with open(filename, 'w') as file:
+            json.dump({'unit': 'ns', 'phases': dict((name, phase.to_dict()) for name, phase in self.phases.items() if phase.calls)},
+                      file, indent = 2, sort_keys = True)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file recording.py
+#
+# @author Régis Clouard
+
+# Compact binary recordings of episodes and their replay.
+#
+# A recording is made of:
+#   - a header (HEADER_FORMAT) with the seed, the episode number, the agent
+#     and the outcome of the episode,
+#   - the initial map, one byte per cell,
+#   - one byte per event: the action of the tortoise (TORTOISE_ACTIONS)
+#     or DOG_EVENT + the move of the dog (DOG_MOVED or its new direction),
+#   - a keyframe after the first tortoise move of every keyframe_interval
+#     events: the number of events played so far (KEYFRAME_FORMAT), the world
+#     state (SNAPSHOT_FORMAT), the action code and the map.
+# An archive is simply recordings written one after the other.
+
+import bisect
+import mmap
+import struct
+from cells import Grid
+from tortoiseworld import TortoiseWorld, SNAPSHOT_FORMAT, TORTOISE_ACTIONS, ACTION_CODES, DOG_EVENT
+
+MAGIC = b'TREC'
+VERSION = 2
+SEEDED = 1 # flag
+NUMBERED = 2 # flag
+
+# magic, version, flags, grid size, keyframe interval, length of the recording,
+# seed, events, keyframes, score, time, eaten, lettuce count, win, episode,
+# agent (the class name of the brain, in UTF-8 padded with zeros)
+HEADER_FORMAT = struct.Struct('<4s 4H 3Q 2q d 2q ? q 32s')
+KEYFRAME_FORMAT = struct.Struct('<Q')
+
+class Recorder():
+    """
+    Records the events of a TortoiseWorld from its initial state: the
+    world appends their codes to self.events as it steps (see
+    TortoiseWorld.record()). Must be created before the first step.
+    The header tells the seed and the number of the episode, when known,
+    and the class of the brain that played it.
+    """
+    KEYFRAME_INTERVAL = 256
+
+    def __init__( self, world, seed = None, episode = None, keyframe_interval = KEYFRAME_INTERVAL ):
+        self.world = world
+        self.seed = seed
+        self.episode = episode
+        self.agent = type(world.tortoise_brain).__name__ if world.tortoise_brain is not None else ''
+        self.keyframe_interval = keyframe_interval
+        self.initial_map = bytes(world.worldmap.cells)
+        self.events = bytearray()
+        self.keyframes = bytearray()
+        self.keyframe_count = 0
+        self.keyframe()
+        world.record(self)
+
+    def keyframe( self ):
+        world = self.world
+        self.keyframes += KEYFRAME_FORMAT.pack(len(self.events))
+        self.keyframes += world.get_state()
+        self.keyframes.append(ACTION_CODES.get(world.action, 0))
+        self.keyframes += world.worldmap.cells
+        self.keyframe_count += 1
+        # Keyframes are only taken after tortoise moves, so that a dog
+        # move costs the world a single append
+        world.next_keyframe = len(self.events) + self.keyframe_interval
+
+    def to_bytes( self ):
+        """
+        Returns the recording of the episode played so far.
+        """
+        world = self.world
+        size = world.grid_size
+        length = HEADER_FORMAT.size + len(self.initial_map) + len(self.events) + len(self.keyframes)
+        flags = (SEEDED if self.seed is not None else 0) | (NUMBERED if self.episode is not None else 0)
+        header = HEADER_FORMAT.pack(MAGIC, VERSION, flags, size, self.keyframe_interval,
+                                    length, self.seed or 0, len(self.events), self.keyframe_count,
+                                    world.score, world.current_time, world.eaten, world.lettuce_count, world.win,
+                                    self.episode or 0, self.agent.encode('utf-8')[:32])
+        return header + self.initial_map + self.events + self.keyframes
+
+    def write( self, file ):
+        """
+        Appends the recording to an open binary file.
+        """
+        file.write(self.to_bytes())
+
+class Recording():
+    """
+    A read-only view of a recording inside a buffer (bytes or mmap)
+    at the given offset. Nothing is copied until it is replayed.
+    """
+
+    def __init__( self, buffer, offset = 0 ):
+        (magic, version, flags, self.grid_size, self.keyframe_interval,
+         self.length, seed, self.event_count, self.keyframe_count,
+         self.score, self.time, self.eaten, self.lettuce_count, self.win,
+         episode, agent) = HEADER_FORMAT.unpack_from(buffer, offset)
+        if magic != MAGIC:
+            raise ValueError('Not a tortoise recording at offset %d' % offset)
+        if version != VERSION:
+            raise ValueError('Tortoise recording of version %d at offset %d, expected version %d' % (version, offset, VERSION))
+        self.seed = seed if flags & SEEDED else None
+        self.episode = episode if flags & NUMBERED else None
+        self.agent = agent.rstrip(b'\0').decode('utf-8', 'replace')
+        self.offset = offset
+        view = memoryview(buffer)[offset:offset + self.length]
+        cells = self.grid_size * self.grid_size
+        start = HEADER_FORMAT.size
+        self.initial_map = view[start:start + cells]
+        self.events = view[start + cells:start + cells + self.event_count]
+        self.keyframe_data = view[start + cells + self.event_count:]
+        self.keyframe_size = KEYFRAME_FORMAT.size + SNAPSHOT_FORMAT.size + 1 + cells
+        self.keyframe_positions = [KEYFRAME_FORMAT.unpack_from(self.keyframe_data, k * self.keyframe_size)[0] for k in range(self.keyframe_count)]
+
+    def keyframe( self, k ):
+        """
+        Returns the number of events played, the state, the action
+        and the map at keyframe k.
+        """
+        data = self.keyframe_data[k * self.keyframe_size:(k + 1) * self.keyframe_size]
+        start = KEYFRAME_FORMAT.size
+        end = start + SNAPSHOT_FORMAT.size
+        return self.keyframe_positions[k], data[start:end], TORTOISE_ACTIONS[data[end]], data[end + 1:]
+
+def read_recordings( buffer ):
+    """
+    Yields the recordings of an archive held in a buffer.
+    Only the headers are read, so scanning a large archive is fast.
+    """
+    offset = 0
+    while offset < len(buffer):
+        recording = Recording(buffer, offset)
+        yield recording
+        offset += recording.length
+
+def open_archive( filename ):
+    """
+    Returns a memory map of an archive file, for read_recordings().
+    """
+    with open(filename, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+
+class Replay():
+    """
+    Replays a recording in a TortoiseWorld without any brain, with the
+    same step(), next_event_time() and is_over() as a world. seek() jumps
+    to any event from the nearest keyframe before it.
+    """
+
+    def __init__( self, recording ):
+        self.recording = recording
+        grid = Grid(recording.grid_size)
+        grid.load(recording.initial_map)
+        self.world = TortoiseWorld(recording.grid_size, None, grid)
+        self.position = 0
+        self.seek(0)
+
+    def seek( self, position ):
+        recording = self.recording
+        position = max(0, min(position, recording.event_count))
+        k = bisect.bisect_right(recording.keyframe_positions, position) - 1
+        self.position, state, action, cells = recording.keyframe(k)
+        world = self.world
+        world.set_state(state, action)
+        world.worldmap.load(cells)
+        while self.position < position:
+            self.play(recording.events[self.position])
+
+    def play( self, code ):
+        world = self.world
+        self.position += 1
+        if code < DOG_EVENT:
+            world.replay_tortoise(TORTOISE_ACTIONS[code])
+        else:
+            world.current_time = world.next_dog_time
+            world.replay_dog(code - DOG_EVENT)
+        return code
+
+    def step( self ):
+        """
+        Plays the next event and notifies the observers of the world.
+        """
+        if self.play(self.recording.events[self.position]) < DOG_EVENT:
+            for observer in self.world.observers:
+                observer.tortoise_moved(self.world)
+        else:
+            for observer in self.world.observers:
+                observer.dog_moved(self.world)
+
+    def next_event_time( self ):
+        if self.recording.events[self.position] < DOG_EVENT:
+            return self.world.next_tortoise_time
+        return self.world.next_dog_time
+
+    def is_over( self ):
+        return self.position >= self.recording.event_count
@@ -0,0 +1,54 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file registry.py
+#
+# @author Régis Clouard
+
+# The agents known by name. A name maps to a "module:Class" spec and the
+# module is only imported when the agent is loaded, so that listing the
+# agents or starting a run imports nothing else. An agent outside the
+# registry, e.g. in another module on the path, is loaded by its spec:
+#
+# > python runs.py -a mybrains:GreedyBrain -b ReflexBrain
+
+import importlib
+
+AGENTS = {
+    'RandomBrain': 'agents:RandomBrain',
+    'ReflexBrain': 'agents:ReflexBrain',
+    'RationalBrain': 'agents:RationalBrain',
+}
+
+def register_agent( name, spec ):
+    """ Makes the agent of the "module:Class" spec known as name. """
+    if ':' not in spec:
+        raise Exception('An agent spec is module:Class, not ' + spec)
+    AGENTS[name] = spec
+
+def agent_names():
+    return sorted(AGENTS)
+
+def load_agent( spec ):
+    """
+    Returns the agent class of a registered name or of a "module:Class"
+    spec, importing its module.
+    """
+    if spec in AGENTS:
+        spec = AGENTS[spec]
+    elif ':' not in spec:
+        raise Exception('Unknown agent: %s (known agents: %s, or module:Class)' % (spec, ', '.join(agent_names())))
+    module_name, class_name = spec.split(':', 1)
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError:
+        raise Exception('No module %s for the agent %s' % (module_name, spec))
+    if not isinstance(getattr(module, class_name, None), type):
+        raise Exception('Unknown agent: no class %s in %s' % (class_name, module_name))
+    return getattr(module, class_name)
@@ -0,0 +1,208 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file results.py
+#
+# @author Régis Clouard
+
+# Per-episode results files (JSON lines or CSV) and their aggregation.
+#
+# > python runs.py -a ReflexBrain -n 1000 --results results.jsonl
+# > python results.py results.jsonl
+
+import sys
+import os
+import io
+import csv
+import json
+from utils import RunningStats
+try:
+    import fcntl
+except ImportError: # not on Windows, where O_APPEND alone is relied on
+    fcntl = None
+
+FIELDS = ['agent', 'episode', 'seed', 'grid_size', 'score', 'time', 'eaten', 'lettuce_count', 'win', 'cause', 'steps', 'think_time', 'wall_time']
+
+def episode_record( agent, episode, result ):
+    """
+    Returns the record of an EpisodeResult (None for a failed episode).
+    """
+    if result is None:
+        record = dict((field, None) for field in FIELDS)
+        record.update(agent = agent, episode = episode, cause = 'error')
+        return record
+    record = dict((field, getattr(result, field, None)) for field in FIELDS)
+    record.update(agent = agent, episode = episode)
+    return record
+
+class ResultSink():
+    """
+    Appends one record per episode to a results file, in JSON lines or
+    in CSV according to its extension (.csv or anything else).
+
+    Records are buffered and each flush writes whole lines with a single
+    write on a file opened in append mode, under an exclusive lock where
+    available: several processes can share the same file without
+    interleaving their lines.
+    """
+    BUFFER_SIZE = 64 # records
+
+    def __init__( self, filename, buffer_size = BUFFER_SIZE ):
+        self.filename = filename
+        self.csv = filename.endswith('.csv')
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write( self, record ):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush( self ):
+        if not self.buffer:
+            return
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            text = io.StringIO()
+            if self.csv:
+                writer = csv.DictWriter(text, FIELDS, lineterminator = '\n')
+                if os.fstat(self.fd).st_size == 0:
+                    writer.writeheader()
+                writer.writerows(self.buffer)
+            else:
+                for record in self.buffer:
+                    text.write(json.dumps(record) + '\n')
+            os.write(self.fd, text.getvalue().encode())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.buffer = []
+
+    def close( self ):
+        self.flush()
+        os.close(self.fd)
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exception ):
+        self.close()
+
+def read_records( filename ):
+    """
+    Yields the records of a results file one at a time. CSV values are
+    converted back to numbers and booleans.
+    """
+    with open(filename, newline = '') as file:
+        if filename.endswith('.csv'):
+            for row in csv.DictReader(file):
+                yield dict((field, parse_value(value)) for field, value in row.items())
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+def parse_value( value ):
+    if value == '':
+        return None
+    if value in ('True', 'False'):
+        return value == 'True'
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+class Aggregate():
+    """
+    Running statistics of a group of records.
+    """
+
+    def __init__( self ):
+        self.episodes = 0
+        self.wins = 0
+        self.causes = {}
+        self.score = RunningStats()
+        self.time = RunningStats()
+        self.steps = RunningStats()
+        self.wall_time = RunningStats()
+
+    def add( self, record ):
+        self.episodes += 1
+        cause = record.get('cause')
+        self.causes[cause] = self.causes.get(cause, 0) + 1
+        if cause == 'error':
+            return
+        if record.get('win'):
+            self.wins += 1
+        for name in ('score', 'time', 'steps', 'wall_time'):
+            if record.get(name) is not None:
+                getattr(self, name).push(record[name])
+
+def aggregate( filenames, keys = ('agent', 'grid_size') ):
+    """
+    Streams the records of the files into one Aggregate per value of
+    the keys; only the aggregates are held in memory.
+    """
+    groups = {}
+    for filename in filenames:
+        for record in read_records(filename):
+            group = tuple(record.get(key) for key in keys)
+            if group not in groups:
+                groups[group] = Aggregate()
+            groups[group].add(record)
+    return groups
+
+def display( groups, keys ):
+    print("%-24s %8s %7s %8s %8s %8s %8s %8s  %s" % (' / '.join(keys), 'Episodes', 'Wins', 'Score', '+/-', 'Time', 'Steps', 'Wall ms', 'Causes'))
+    for group in sorted(groups, key = lambda group: tuple(str(value) for value in group)):
+        stats = groups[group]
+        low, high = stats.score.interval()
+        causes = ', '.join('%s %d' % (cause, count) for cause, count in sorted(stats.causes.items(), key = lambda item: -item[1]))
+        print("%-24s %8d %7d %8.1f %8.1f %8.1f %8.1f %8.2f  %s" % (' / '.join(str(value) for value in group), stats.episodes, stats.wins,
+                                                             stats.score.mean, (high - low) / 2, stats.time.mean, stats.steps.mean,
+                                                             1000 * stats.wall_time.mean, causes))
+
+def default( str ):
+    return str + ' [Default: %default]'
+
+def read_command( argv ):
+    """ Processes the command used to aggregate results files from the command line. """
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python results.py <options> FILE...
+    EXAMPLES:   python results.py results.jsonl other.csv
+                    - statistics of the episodes of both files by agent and grid size
+    """
+    parser = OptionParser(usageStr)
+
+    parser.add_option('-g', '--group-by', dest = 'keys',
+                      help = default('Comma separated fields grouping the episodes'), default = 'agent,grid_size')
+
+    options, filenames = parser.parse_args(argv)
+    if len(filenames) == 0:
+        raise Exception('No results file given')
+    return dict(filenames = filenames, keys = tuple(key for key in options.keys.split(',') if key))
+
+if __name__ == '__main__':
+    """ The main function called when results.py is run
+    from the command line:
+
+    > python results.py results.jsonl
+
+    See the usage string for more details.
+
+    > python results.py --help
+    > python results.py -h """
+    args = read_command(sys.argv[1:])
+    display(aggregate(**args), args['keys'])
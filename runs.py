@@ -13,32 +13,275 @@
 # @author Régis Clouard
 
 import sys
+import io
+import math
+import os
 import random
-from tortoiseworld import TortoiseFrame
-
-def runs( agent, width, number ):
-    """ The real main. """
-    wins = 0
-    meanScore = 0 
-    random.seed(random.random())
-    tortoise = agent()
-    for i in range(number):
+import diagnostics
+from tortoiseworld import run_episode, TortoiseWorld, generate_worldmap, stone_candidates
+from registry import load_agent
+from checkpoint import checkpoint_config
+from utils import TimeBudget, RunningStats, derive_seed, wilson_interval
+
+class AgentStatistics():
+    """
+    The running statistics of the episodes played by one agent.
+    """
+
+    def __init__( self, name ):
+        self.name = name
+        self.wins = 0
+        self.scores = RunningStats()
+        self.think_time = 0
+        self.move_overruns = 0
+        self.exhausted = 0
+        self.failures = []
+
+    def add( self, result ):
+        self.scores.push(result.score)
+        self.think_time += result.think_time
+        self.move_overruns += result.move_overruns
+        if result.budget_exhausted:
+            self.exhausted += 1
+        if result.win:
+            self.wins += 1
+
+    def display( self, confidence ):
+        played = self.scores.n
+        low, high = self.scores.interval(confidence)
+        win_low, win_high = wilson_interval(self.wins, played, confidence)
+        print("\nStatistics of %s" % self.name)
+        if self.failures:
+            print("   Failures  : %d episodes (%s), left out." % (len(self.failures), ', '.join(str(i) for i in self.failures)))
+        print("   Matches   : %d wins / %d loses, win rate in [%.3f, %.3f]." % (self.wins, played - self.wins, win_low, win_high))
+        print("   Mean score: %.1f, in [%.1f, %.1f]." % (self.scores.mean, low, high))
+        print("   Think time: %.2f ms per episode, %d moves and %d episodes over budget." % (1000 * self.think_time / max(played, 1), self.move_overruns, self.exhausted))
+
+def sprt_decision( differences, min_difference, confidence ):
+    """
+    Wald's sequential probability ratio test on paired score differences
+    (agent - versus), normal with the running variance: is the mean
+    difference +min_difference rather than -min_difference?
+    Returns 1 (the agent is better), -1 (the versus agent is better)
+    or 0 (keep playing). Both error rates are 1 - confidence.
+    """
+    variance = differences.variance()
+    if variance == 0:
+        return 0
+    error = 1 - confidence
+    bound = math.log((1 - error) / error)
+    llr = 2 * min_difference * differences.mean * differences.n / variance
+    if llr >= bound:
+        return 1
+    if llr <= -bound:
+        return -1
+    return 0
+
+def runs( agent, width, number, move_budget, episode_budget, random_seed, record, jobs,
+          versus = (), ci_width = None, confidence = 0.95, min_episodes = 10, min_difference = 5.0, profile = None, results_file = None,
+          brain_config = None, log_level = 'warning', learn = False ):
+    """ The real main.
+    Episode i is played with the seed derive_seed(random_seed, i),
+    so that it can be replayed with tortoise.py -r random_seed -e i.
+    With record, every episode is recorded in the archive file record,
+    once per agent, to be watched with tortoise.py --replay record -e i
+    (and -a agent in a tournament): the recordings tell their episode
+    and agent, since failed episodes have none.
+    Every episode is played by new brains: a learning agent starts each
+    of them from the weights it has at the start of the run (its
+    snapshot()), so that the episodes are independent. They are spread
+    over jobs worker processes and their results come back in episode
+    order, so the statistics and the archive do not depend on the number
+    of workers. With learn, the episodes are played in order by the same
+    brains, which keep learning from one to the next (jobs must be 1).
+
+    With versus agents, it is a tournament: every agent plays each
+    episode on the same map with the same dog, and the paired score
+    differences of every two agents are reported.
+
+    Up to number episodes are played, fewer when the evaluation is
+    conclusive: once min_episodes are played, it stops when the
+    confidence interval of the mean score (of every difference in a
+    tournament) is narrower than ci_width or, with a single versus agent,
+    when the sequential test tells which agent is better by
+    min_difference points.
+
+    With profile, the phases of the episodes are timed (see instrument.py)
+    and the measures are printed and saved in the file profile.
+    With results_file, the result of every episode is appended to it
+    as soon as it is known (see results.py).
+    The agents that can be configured (see RationalBrain.configure())
+    are given brain_config, e.g. to resume from a checkpoint or, with
+    learn, to save checkpoints.
+    Messages under log_level are not written (see diagnostics.py); the
+    trace of the last moves is written when an episode fails. """
+    if random_seed < 0:
+        random_seed = random.randrange(2 ** 32)
+    print("Random seed:", random_seed)
+    brains = [agent] + list(versus)
+    statistics = [AgentStatistics(brain.__name__) for brain in brains]
+    pairs = [(a, b) for a in range(len(brains)) for b in range(a + 1, len(brains))]
+    differences = dict((pair, RunningStats()) for pair in pairs)
+    decision = 0
+    record_file = open(record, 'wb') if record is not None else None
+    sink = None
+    if results_file is not None:
+        from results import ResultSink, episode_record
+        sink = ResultSink(results_file)
+    tasks = ((i, width, derive_seed(random_seed, i), record is not None) for i in range(number))
+    configs = brain_configs(brains, brain_config, learn)
+    init_worker(brains, configs, learn, move_budget, episode_budget, profile is not None, log_level)
+    report = None
+    if profile is not None:
+        from instrument import Instrumentation
+        report = Instrumentation()
+    pool = None
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs, init_worker, (brains, configs, learn, move_budget, episode_budget, profile is not None, log_level))
+        results = pool.imap(play_episode, tasks)
+    else:
+        results = map(play_episode, tasks)
+    episodes = 0
+    for episode, outcomes, measures in results:
+        if measures is not None:
+            report.merge(measures)
+        scores = [None] * len(brains)
+        for k, (result, recording, error) in enumerate(outcomes):
+            if error is not None:
+                statistics[k].failures.append(episode)
+                print("\nEpisode %d of %s failed: %s" % (episode, statistics[k].name, error))
+            else:
+                statistics[k].add(result)
+                scores[k] = result.score
+                if record_file is not None:
+                    record_file.write(recording)
+            if sink is not None:
+                sink.write(episode_record(statistics[k].name, episode, result))
+        for a, b in pairs:
+            if scores[a] is not None and scores[b] is not None:
+                differences[(a, b)].push(scores[a] - scores[b])
+        episodes = episode + 1
+
         bar_length = 50
-        percent = (i / number) * 100
-        filled_length = int(bar_length * i // number)
+        percent = (episodes / number) * 100
+        filled_length = int(bar_length * episodes // number)
         bar = '#' * filled_length + ' ' * (bar_length - filled_length)
+        print(f'\rEpisode : {episodes} [{bar}] {percent:.2f}%  wins: {statistics[0].wins}  mean score: {statistics[0].scores.mean:.1f}', end='', flush=True)
+
+        # Stop as soon as the evaluation is conclusive
+        if episodes < min_episodes:
+            continue
+        if len(brains) == 2:
+            decision = sprt_decision(differences[(0, 1)], min_difference, confidence)
+            if decision != 0:
+                break
+        if ci_width is not None:
+            intervals = [stats.interval(confidence) for stats in differences.values()] if pairs else [statistics[0].scores.interval(confidence)]
+            if max(high - low for low, high in intervals) <= ci_width:
+                break
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+    if record_file is not None:
+        record_file.close()
+    if sink is not None:
+        sink.close()
+    print()
+    for agent_statistics in statistics:
+        agent_statistics.display(confidence)
+    if pairs:
+        print("\nComparison (paired on the same episodes)")
+        for a, b in pairs:
+            stats = differences[(a, b)]
+            low, high = stats.interval(confidence)
+            verdict = ''
+            if low > 0 or high < 0:
+                verdict = ', %s is better' % statistics[a if low > 0 else b].name
+            print("   %s - %s: %.1f, in [%.1f, %.1f]%s." % (statistics[a].name, statistics[b].name, stats.mean, low, high, verdict))
+        if len(brains) == 2:
+            if decision == 0:
+                print("   Decision  : none, no difference of %.1f points shown." % min_difference)
+            else:
+                print("   Decision  : %s is better." % statistics[0 if decision > 0 else 1].name)
+    if report is not None:
+        print("\nProfile (saved in %s)" % profile)
+        print(report.table())
+        report.save(profile)
+    if number > 0:
+        print("\nStopped after %d of %d episodes: %d episodes (%.0f%%) saved." % (episodes, number, number - episodes, 100.0 * (number - episodes) / number))
+    else:
+        print("\nNo episode to play.")
+
+def new_brain( agent, config ):
+    brain = agent()
+    if config:
+        brain.configure(config)
+    return brain
+
+def brain_configs( agents, brain_config, learn ):
+    """
+    Returns the configure() dict of every agent, None for the agents
+    that cannot be configured. Unless learn, an agent with a snapshot()
+    gets that of a brain configured with brain_config, so that all its
+    brains start from the same weights.
+    """
+    configs = []
+    for agent in agents:
+        if not hasattr(agent, 'configure'):
+            configs.append(None)
+        elif learn or not hasattr(agent, 'snapshot'):
+            configs.append(brain_config)
+        else:
+            configs.append(new_brain(agent, brain_config).snapshot())
+    return configs
+
+# The agents, the brains (with learn), the time budget and the
+# instrumentation of the current (worker) process
+worker_agents = None
+worker_brains = None
+worker_budget = None
+worker_instrumentation = None
+stone_candidates_cache = {}
 
-        #print(f'\rLearning iteration : {i} [{bar}] {percent:.2f}%', end='')
+def init_worker( agents, configs, learn, move_budget, episode_budget, profile = False, log_level = 'warning' ):
+    global worker_agents, worker_brains, worker_budget, worker_instrumentation
+    diagnostics.set_level(log_level)
+    worker_agents = list(zip(agents, configs))
+    worker_brains = [new_brain(agent, config) for agent, config in worker_agents] if learn else None
+    worker_budget = TimeBudget(move_budget, episode_budget)
+    if profile and worker_instrumentation is None:
+        from instrument import Instrumentation
+        worker_instrumentation = Instrumentation()
+        worker_instrumentation.install(agents)
 
-        tortoise.init(width)
-        tf = TortoiseFrame(width, 0, tortoise, True)
-        #print("Score:", tf.tw.score, "Time:", tf.tw.current_time)
-        meanScore += tf.tw.score
-        if tf.is_win():
-            wins += 1
-    print("\nStatistics")
-    print("   Matches   : %d wins / %d loses." % (wins, number - wins))
-    print("   Mean score: %.1f." % (meanScore / number))
+def play_episode( task ):
+    """
+    Plays one episode with new brains of every agent (or the brains of
+    the process, with learn) and returns (episode, outcomes, measures),
+    with an outcome (EpisodeResult, recording, error) per brain. An exception raised by the episode is
+    returned as the error instead of the result.
+    The map is generated once, as the world would from the seed, and
+    each brain plays on its own copy.
+    """
+    episode, width, seed, record = task
+    brains = worker_brains or [new_brain(agent, config) for agent, config in worker_agents]
+    worldmap = None
+    if len(brains) > 1:
+        if width not in stone_candidates_cache:
+            stone_candidates_cache[width] = stone_candidates(width)
+        worldmap = generate_worldmap(width, stone_candidates_cache[width], random.Random(derive_seed(seed, 'map')))
+    outcomes = []
+    for brain in brains:
+        record_file = io.BytesIO() if record else None
+        try:
+            result = run_episode(width, brain, worker_budget, seed, record_file, worldmap.copy() if worldmap is not None else None, episode)
+            outcomes.append((result, record_file.getvalue() if record else None, None))
+        except Exception:
+            import traceback
+            outcomes.append((None, None, traceback.format_exc().strip().splitlines()[-1]))
+    measures = worker_instrumentation.collect() if worker_instrumentation is not None else None
+    return episode, outcomes, measures
 
 def default( str ):
     return str + ' [Default: %default]'
@@ -55,12 +298,48 @@ def read_command( argv ):
     parser = OptionParser(usageStr)
     
     parser.add_option('-a', '--agent', dest = 'agent',
-                      help = default('the agent to use'),
+                      help = default('the agent to use, by name or as module:Class'),
                       metavar = 'TYPE', default = 'ReflexBrain')
     parser.add_option('-w', '--width', dest = 'width',
                       help = default('World width'), default = 15)
     parser.add_option('-n', '--number', dest = 'number',
                       help = default('Number of executions'), default = 10)
+    parser.add_option('-r', '--random-seed', dest = 'random_seed', type = 'int',
+                      help = default('Master random seed, -1 to draw one'), default = -1)
+    parser.add_option('--move-budget', dest = 'move_budget', type = 'float',
+                      help = default('Thinking time allowed per move in seconds'), default = TortoiseWorld.MOVE_BUDGET)
+    parser.add_option('--episode-budget', dest = 'episode_budget', type = 'float',
+                      help = default('Thinking time allowed per episode in seconds'), default = TortoiseWorld.EPISODE_BUDGET)
+    parser.add_option('--record', dest = 'record', metavar = 'FILE',
+                      help = 'Record all the episodes of every agent in the archive FILE', default = None)
+    parser.add_option('-j', '--jobs', dest = 'jobs', type = 'int',
+                      help = default('Number of worker processes, 0 for one per CPU'), default = 1)
+    parser.add_option('-b', '--versus', dest = 'versus', metavar = 'TYPE', action = 'append',
+                      help = 'Agent to compare with on the same episodes, stopping once one is better; repeat it for a tournament', default = [])
+    parser.add_option('--ci-width', dest = 'ci_width', type = 'float',
+                      help = 'Stop once the confidence interval of the mean score (or of the difference) is narrower', default = None)
+    parser.add_option('--confidence', dest = 'confidence', type = 'float',
+                      help = default('Confidence level of the intervals and of the test'), default = 0.95)
+    parser.add_option('--min-episodes', dest = 'min_episodes', type = 'int',
+                      help = default('Episodes played before stopping early'), default = 10)
+    parser.add_option('--min-difference', dest = 'min_difference', type = 'float',
+                      help = default('Score difference the comparison has to detect'), default = 5.0)
+    parser.add_option('--results', dest = 'results_file', metavar = 'FILE',
+                      help = 'Append the result of every episode to FILE (JSON lines, or CSV for a .csv file)', default = None)
+    parser.add_option('--profile', dest = 'profile', metavar = 'FILE',
+                      help = 'Time the phases of the episodes and save the measures in FILE (JSON)', default = None)
+    parser.add_option('--log-level', dest = 'log_level', type = 'choice', choices = ['error', 'warning', 'info', 'debug'],
+                      help = default('Level of the messages written on the standard error (debug: the agent memory at every move)'), default = 'warning')
+    parser.add_option('--learn', dest = 'learn', action = 'store_true',
+                      help = 'Play the episodes in order with the same brains, which keep learning (needs -j 1)', default = False)
+    parser.add_option('--checkpoint', dest = 'checkpoint', metavar = 'DIR',
+                      help = 'Save checkpoints of the learning agent in DIR [Default: checkpoints]', default = None)
+    parser.add_option('--checkpoint-every', dest = 'checkpoint_moves', type = 'int', metavar = 'N',
+                      help = 'Save a checkpoint every N moves [Default: at the end of every episode]', default = None)
+    parser.add_option('--resume', dest = 'resume', metavar = 'PATH',
+                      help = 'Resume the learning agent from a checkpoint file, or the latest one of a directory', default = None)
+    parser.add_option('--save-weights', dest = 'save_weights', metavar = 'FILE',
+                      help = 'Also save the weights of the learning agent in FILE, e.g. weights.txt', default = None)
     
     options, otherjunk = parser.parse_args(argv)
 
@@ -69,18 +348,31 @@ def read_command( argv ):
     args = dict()
     
     # Choose a Tortoise solver
-    try:
-        module = __import__('agents')
-        if options.agent in dir(module):
-            agent = getattr(module, options.agent)
-            args['agent'] = agent
-        else:
-            raise Exception('Unknown agent: ' + options.agent)
-    except ImportError:
-        raise Exception('No file agents.py')
+    args['agent'] = load_agent(options.agent)
+    args['versus'] = [load_agent(spec) for spec in options.versus]
+    args['brain_config'] = checkpoint_config(options)
+    args['learn'] = options.learn
+    if not options.learn and set(args['brain_config']) - {'resume'}:
+        raise Exception('--checkpoint, --checkpoint-every and --save-weights save what is learned: they need --learn')
+    args['log_level'] = options.log_level
     
     args['width'] = int(options.width)
     args['number'] = int(options.number)
+    if args['number'] < 0:
+        raise Exception('The number of executions cannot be negative: ' + str(options.number))
+    args['move_budget'] = options.move_budget
+    args['episode_budget'] = options.episode_budget
+    args['random_seed'] = options.random_seed
+    args['record'] = options.record
+    args['jobs'] = options.jobs if options.jobs > 0 else os.cpu_count()
+    if options.learn and args['jobs'] != 1:
+        raise Exception('--learn plays the episodes in order in one process: it needs -j 1')
+    args['ci_width'] = options.ci_width
+    args['confidence'] = options.confidence
+    args['min_episodes'] = options.min_episodes
+    args['min_difference'] = options.min_difference
+    args['profile'] = options.profile
+    args['results_file'] = options.results_file
 
     return args
 
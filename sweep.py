@@ -0,0 +1,236 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file sweep.py
+#
+# @author Régis Clouard
+
+# Hyperparameter sweep of the RationalBrain with successive halving.
+#
+# A configuration is a dict for RationalBrain.configure(). Running it on
+# a seed plays a few episodes in a row (the brain learning from one to
+# the next) from the same initial weights, and scores it with the mean
+# score. Every configuration is run on a few seeds, the best 1 / eta
+# of them on eta times more seeds, and so on.
+#
+# Finished (configuration, seed) runs are cached in a file, so that an
+# interrupted or extended sweep never plays them again.
+#
+# The search space is a JSON file mapping each parameter (alpha, epsilon,
+# gamma, weights, or rewards.<name> for a constant of RationalBrain.REWARDS)
+# to a list of values, or for a random search to a distribution:
+#   {"alpha": [0.1, 0.3], "epsilon": {"uniform": [0.05, 0.5]},
+#    "rewards.eat": {"randint": [20, 80]}, "gamma": {"loguniform": [0.01, 0.9]}}
+
+import sys
+import os
+import json
+import math
+import random
+import itertools
+import contextlib
+import multiprocessing
+import agents
+from results import ResultSink, read_records
+from tortoiseworld import run_episode
+from utils import TimeBudget, derive_seed
+
+DEFAULT_SPACE = {'alpha': [0.1, 0.3, 0.5], 'epsilon': [0.1, 0.3, 0.5], 'gamma': [0.1, 0.3, 0.6]}
+
+def grid_configurations( space ):
+    """ Returns all the combinations of the values of the space. """
+    names = sorted(space)
+    for name in names:
+        if not isinstance(space[name], list):
+            raise Exception('A grid search needs a list of values for ' + name)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+def random_configurations( space, number, rng ):
+    """ Returns number configurations drawn from the space. """
+    configurations = []
+    for i in range(number):
+        configuration = {}
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, list):
+                configuration[name] = rng.choice(values)
+            elif 'uniform' in values:
+                configuration[name] = rng.uniform(*values['uniform'])
+            elif 'loguniform' in values:
+                low, high = values['loguniform']
+                configuration[name] = math.exp(rng.uniform(math.log(low), math.log(high)))
+            elif 'randint' in values:
+                configuration[name] = rng.randint(*values['randint'])
+            else:
+                raise Exception('Unknown distribution for ' + name + ': ' + str(values))
+        configurations.append(configuration)
+    return configurations
+
+def brain_config( configuration ):
+    """ Turns a flat configuration (rewards.<name> keys) into a configure() dict. """
+    config = {}
+    for name, value in configuration.items():
+        if name.startswith('rewards.'):
+            config.setdefault('rewards', {})[name[len('rewards.'):]] = value
+        else:
+            config[name] = value
+    return config
+
+def configuration_key( configuration ):
+    return json.dumps(configuration, sort_keys = True)
+
+def play_run( task ):
+    """
+    Plays a run of a configuration on a seed in a fresh brain and
+    returns (key, seed, mean score, wins).
+    """
+    key, seed, width, episodes = task
+    brain = agents.RationalBrain()
+    brain.configure(brain_config(json.loads(key)))
+    score = wins = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(episodes):
+            result = run_episode(width, brain, TimeBudget(None, None), derive_seed(seed, i))
+            score += result.score
+            wins += result.win
+    return key, seed, float(score) / episodes, wins
+
+class RunCache():
+    """
+    The finished runs, by (configuration key, seed), appended to a
+    JSON lines file as soon as they are known.
+    """
+
+    def __init__( self, filename, width, episodes ):
+        self.width = width
+        self.episodes = episodes
+        self.runs = {}
+        if os.path.exists(filename):
+            for record in read_records(filename):
+                if record['width'] == width and record['episodes'] == episodes:
+                    self.runs[(record['config'], record['seed'])] = record['score']
+        self.sink = ResultSink(filename, buffer_size = 1)
+
+    def add( self, key, seed, score, wins ):
+        self.runs[(key, seed)] = score
+        self.sink.write({'config': key, 'seed': seed, 'width': self.width, 'episodes': self.episodes, 'score': score, 'wins': wins})
+
+    def close( self ):
+        self.sink.close()
+
+def sweep( space, search, samples, width, episodes, seeds, eta, max_seeds, random_seed, jobs, cache_file ):
+    """ The real main. Returns the configurations ranked by mean score. """
+    if 'weights' not in space:
+        # Start from the current weights, which are then part of the cache key
+        with open(agents.RationalBrain.WEIGHTS_FILE) as file:
+            space['weights'] = [[float(line) for line in file if line.strip()]]
+    if search == 'grid':
+        configurations = grid_configurations(space)
+    else:
+        configurations = random_configurations(space, samples, random.Random(derive_seed(random_seed, 'sweep')))
+    keys = list(dict.fromkeys(configuration_key(configuration) for configuration in configurations))
+    cache = RunCache(cache_file, width, episodes)
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    print("Random seed: %d, %d configurations, %d cached runs" % (random_seed, len(keys), len(cache.runs)))
+    rung = 0
+    count = seeds
+    while True:
+        run_seeds = [derive_seed(random_seed, k) for k in range(count)]
+        tasks = [(key, seed, width, episodes) for key in keys for seed in run_seeds if (key, seed) not in cache.runs]
+        print("Rung %d: %d configurations on %d seeds, %d runs to play" % (rung, len(keys), count, len(tasks)))
+        runs = pool.imap_unordered(play_run, tasks) if pool is not None else map(play_run, tasks)
+        for done, run in enumerate(runs):
+            cache.add(*run)
+            print('\r   %d / %d' % (done + 1, len(tasks)), end = '', flush = True)
+        if tasks:
+            print()
+        scores = dict((key, sum(cache.runs[(key, seed)] for seed in run_seeds) / count) for key in keys)
+        ranking = sorted(keys, key = lambda key: -scores[key])
+        if len(keys) == 1 or count * eta > max_seeds:
+            break
+        # Successive halving: only the best configurations go on, on more seeds
+        keys = ranking[:max(1, int(math.ceil(len(keys) / float(eta))))]
+        count *= eta
+        rung += 1
+    if pool is not None:
+        pool.close()
+        pool.join()
+    cache.close()
+    print("\nBest configurations (mean score over %d seeds of %d episodes)" % (count, episodes))
+    for key in ranking[:10]:
+        configuration = json.loads(key)
+        if len(space['weights']) == 1:
+            del configuration['weights'] # the same for all
+        print("   %8.2f  %s" % (scores[key], json.dumps(configuration, sort_keys = True)))
+    return [(json.loads(key), scores[key]) for key in ranking]
+
+def default( str ):
+    return str + ' [Default: %default]'
+
+def read_command( argv ):
+    """ Processes the command used to run a sweep from the command line. """
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python sweep.py <options>
+    EXAMPLES:   python sweep.py -j 8
+                    - grid search of alpha, epsilon and gamma
+                python sweep.py -s space.json --search random -n 50 -j 8
+                    - random search of 50 configurations of the space
+    """
+    parser = OptionParser(usageStr)
+
+    parser.add_option('-s', '--space', dest = 'space', metavar = 'FILE',
+                      help = 'JSON file of the search space [Default: alpha, epsilon and gamma]', default = None)
+    parser.add_option('--search', dest = 'search', type = 'choice', choices = ['grid', 'random'],
+                      help = default('grid or random search'), default = 'grid')
+    parser.add_option('-n', '--samples', dest = 'samples', type = 'int',
+                      help = default('Configurations drawn by a random search'), default = 20)
+    parser.add_option('-w', '--width', dest = 'width', type = 'int',
+                      help = default('World width'), default = 15)
+    parser.add_option('-e', '--episodes', dest = 'episodes', type = 'int',
+                      help = default('Episodes played in a row by a run'), default = 5)
+    parser.add_option('--seeds', dest = 'seeds', type = 'int',
+                      help = default('Runs per configuration in the first rung'), default = 2)
+    parser.add_option('--eta', dest = 'eta', type = 'int',
+                      help = default('Only the best 1 / eta configurations go to the next rung, on eta times more runs'), default = 3)
+    parser.add_option('--max-seeds', dest = 'max_seeds', type = 'int',
+                      help = default('Runs per configuration in the last rung, at most'), default = 18)
+    parser.add_option('-r', '--random-seed', dest = 'random_seed', type = 'int',
+                      help = default('Master random seed'), default = 1)
+    parser.add_option('-j', '--jobs', dest = 'jobs', type = 'int',
+                      help = default('Number of worker processes, 0 for one per CPU'), default = 1)
+    parser.add_option('--cache', dest = 'cache_file', metavar = 'FILE',
+                      help = default('File of the finished runs'), default = 'sweep-cache.jsonl')
+
+    options, otherjunk = parser.parse_args(argv)
+
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    space = DEFAULT_SPACE
+    if options.space is not None:
+        with open(options.space) as file:
+            space = json.load(file)
+    return dict(space = dict(space), search = options.search, samples = options.samples, width = options.width,
+                episodes = options.episodes, seeds = options.seeds, eta = max(options.eta, 2), max_seeds = options.max_seeds,
+                random_seed = options.random_seed, jobs = options.jobs if options.jobs > 0 else os.cpu_count(),
+                cache_file = options.cache_file)
+
+if __name__ == '__main__':
+    """ The main function called when sweep.py is run
+    from the command line:
+
+    > python sweep.py
+
+    See the usage string for more details.
+
+    > python sweep.py --help
+    > python sweep.py -h """
+    args = read_command(sys.argv[1:])
+    sweep(**args)
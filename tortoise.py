@@ -13,16 +13,97 @@
 # @author Régis Clouard
 
 import sys
-import random
-from tortoiseworld import TortoiseFrame
+import time
+import diagnostics
+from tortoiseworld import TortoiseWorld, EpisodeResult, run_episode
+from utils import derive_seed
+from registry import load_agent
+from checkpoint import checkpoint_config
 
-def run_agents( agent, speed, width, random_seed ):
+def run_agents( agent, speed, width, random_seed, episode, quiet, record, replay, start, profile, results_file, trace = None ):
     """ The real main. """
-    if random_seed >=0:
-        random.seed(random_seed)
-    agent.init(width)
-    tf = TortoiseFrame(width, speed, agent, False)
-    print("Score:", tf.tw.score, "Time:", tf.tw.current_time)
+    if replay is not None:
+        replay_recording(replay, episode, type(agent).__name__, speed, quiet, start)
+        return
+    instrumentation = None
+    if profile is not None:
+        from instrument import Instrumentation
+        instrumentation = Instrumentation()
+    seed = None
+    if random_seed >= 0:
+        # The same episode as the one played by runs.py -r random_seed
+        seed = derive_seed(random_seed, episode)
+    record_file = open(record, 'wb') if record is not None else None
+    if quiet:
+        if instrumentation is not None:
+            instrumentation.install([type(agent)])
+        result = run_episode(width, agent, seed = seed, record = record_file, episode = episode if seed is not None else None)
+        print("Score:", result.score, "Time:", result.time)
+    else:
+        from tortoiseframe import TortoiseFrame
+        if instrumentation is not None:
+            instrumentation.install([type(agent)], TortoiseFrame)
+        if seed is not None and hasattr(agent, 'seed'):
+            agent.seed(derive_seed(seed, 'agent'))
+        agent.init(width)
+        tw = TortoiseWorld(width, agent, seed = seed)
+        if record_file is not None:
+            from recording import Recorder
+            recorder = Recorder(tw, seed, episode if seed is not None else None)
+        start_time = time.perf_counter()
+        TortoiseFrame(tw, speed).run()
+        if hasattr(agent, 'end'):
+            agent.end()
+        if record_file is not None:
+            recorder.write(record_file)
+        result = EpisodeResult(tw, time.perf_counter() - start_time)
+        print("Score:", tw.score, "Time:", tw.current_time)
+    if results_file is not None:
+        from results import ResultSink, episode_record
+        with ResultSink(results_file) as sink:
+            sink.write(episode_record(type(agent).__name__, episode, result))
+    if record_file is not None:
+        record_file.close()
+    if instrumentation is not None:
+        instrumentation.uninstall()
+        print(instrumentation.table())
+        instrumentation.save(profile)
+    if trace is not None:
+        with open(trace, 'w') as file:
+            diagnostics.dump(file)
+
+def replay_recording( filename, episode, agent, speed, quiet, start ):
+    """
+    Replays the recording of episode number episode of an archive from
+    event start, or only lists the recordings of the archive in quiet mode.
+    In a tournament archive, agent (a class name) chooses the recording
+    among those of the episode. The recordings of an archive without
+    episode numbers are taken in order.
+    """
+    from recording import open_archive, read_recordings, Replay
+    archive = open_archive(filename)
+    recordings = list(read_recordings(archive))
+    if quiet:
+        for i, recording in enumerate(recordings):
+            print("%4d  Episode: %s Agent: %s Seed: %s Score: %d Time: %d Eaten: %d/%d Events: %d%s" % (i, recording.episode, recording.agent, recording.seed, recording.score, recording.time, recording.eaten, recording.lettuce_count, recording.event_count, " (win)" if recording.win else ""))
+        return
+    if all(recording.episode is None for recording in recordings):
+        if not 0 <= episode < len(recordings):
+            raise Exception('%s holds %d recordings, not episode %d' % (filename, len(recordings), episode))
+        recording = recordings[episode]
+    else:
+        candidates = [recording for recording in recordings if recording.episode == episode]
+        if not candidates:
+            raise Exception('No recording of episode %d in %s' % (episode, filename))
+        if len(candidates) > 1:
+            candidates = [recording for recording in candidates if recording.agent == agent] or candidates
+            if len(candidates) > 1:
+                raise Exception('Episode %d was played by %s: choose one with -a' % (episode, ', '.join(recording.agent for recording in candidates)))
+        recording = candidates[0]
+    from tortoiseframe import TortoiseFrame
+    player = Replay(recording)
+    player.seek(start)
+    TortoiseFrame(player.world, speed, player).run()
 
 def default( str ):
     return str + ' [Default: %default]'
@@ -35,11 +116,14 @@ def read_command( argv ):
     EXAMPLES:   python tortoise.py --agent ReflexBrain
                 OR  python tortoise.py -a ReflexBrain
                     - run tortoise with the reflex agent
+                python tortoise.py --replay episodes.trec -e 3
+                    - replay episode 3 recorded by runs.py --record
+                      (-a chooses the agent in a tournament)
     """
     parser = OptionParser(usageStr)
     
     parser.add_option('-a', '--agent', dest = 'agent',
-                      help = default('The agent to use'),
+                      help = default('The agent to use, by name or as module:Class'),
                       metavar = 'TYPE', default = 'ReflexBrain')
     parser.add_option('-w', '--width', dest = 'width',
                       help = default('World width'), default = 15)
@@ -47,6 +131,32 @@ def read_command( argv ):
                       help = default('Speed'), default = 40)
     parser.add_option('-r', '--random-seed', dest = 'random_seed',
                       help = default('Random'), default = -1)
+    parser.add_option('-e', '--episode', dest = 'episode', type = 'int',
+                      help = default('Episode number, with a random seed'), default = 0)
+    parser.add_option('-q', '--quiet', dest = 'quiet', action = 'store_true',
+                      help = 'Run without graphics', default = False)
+    parser.add_option('--record', dest = 'record', metavar = 'FILE',
+                      help = 'Record the episode in FILE', default = None)
+    parser.add_option('--replay', dest = 'replay', metavar = 'FILE',
+                      help = 'Replay episode -e of the archive FILE, played by agent -a in a tournament (list it with -q)', default = None)
+    parser.add_option('--start', dest = 'start', type = 'int',
+                      help = default('Event where the replay starts'), default = 0)
+    parser.add_option('--results', dest = 'results_file', metavar = 'FILE',
+                      help = 'Append the result of the episode to FILE (JSON lines, or CSV for a .csv file)', default = None)
+    parser.add_option('--profile', dest = 'profile', metavar = 'FILE',
+                      help = 'Time the phases of the episode and save the measures in FILE (JSON)', default = None)
+    parser.add_option('--log-level', dest = 'log_level', type = 'choice', choices = ['error', 'warning', 'info', 'debug'],
+                      help = default('Level of the messages written on the standard error (debug: the agent memory at every move)'), default = 'warning')
+    parser.add_option('--trace', dest = 'trace', metavar = 'FILE',
+                      help = 'Write the trace of the last moves in FILE at the end of the episode', default = None)
+    parser.add_option('--checkpoint', dest = 'checkpoint', metavar = 'DIR',
+                      help = 'Save checkpoints of the learning agent in DIR [Default: checkpoints]', default = None)
+    parser.add_option('--checkpoint-every', dest = 'checkpoint_moves', type = 'int', metavar = 'N',
+                      help = 'Save a checkpoint every N moves [Default: at the end of the episode]', default = None)
+    parser.add_option('--resume', dest = 'resume', metavar = 'PATH',
+                      help = 'Resume the learning agent from a checkpoint file, or the latest one of a directory', default = None)
+    parser.add_option('--save-weights', dest = 'save_weights', metavar = 'FILE',
+                      help = 'Also save the weights of the learning agent in FILE, e.g. weights.txt', default = None)
     
     options, otherjunk = parser.parse_args(argv)
 
@@ -55,19 +165,25 @@ def read_command( argv ):
     args = dict()
     
     # Choose a Tortoise solver
-    try:
-        module = __import__('agents')
-        if options.agent in dir(module):
-            agent = getattr(module, options.agent)
-            args['agent'] = agent()
-        else:
-            raise Exception('Unknown agent: ' + options.agent)
-    except ImportError:
-        raise Exception('No file agents.py')
+    args['agent'] = load_agent(options.agent)()
+    config = checkpoint_config(options)
+    if config:
+        if not hasattr(args['agent'], 'configure'):
+            raise Exception('The agent %s has no checkpoints' % options.agent)
+        args['agent'].configure(config)
     
     args['width'] = int(options.width)
     args['speed'] = int(options.speed)
     args['random_seed'] = int(options.random_seed)
+    args['episode'] = options.episode
+    args['quiet'] = options.quiet
+    args['record'] = options.record
+    args['replay'] = options.replay
+    args['start'] = options.start
+    args['profile'] = options.profile
+    args['results_file'] = options.results_file
+    args['trace'] = options.trace
+    diagnostics.set_level(options.log_level)
     return args
 
 if __name__ == '__main__':
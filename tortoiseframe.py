@@ -0,0 +1,175 @@
+# -*- coding: utf-8; mode: python -*-
+
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+
+# @file tortoiseframe.py
+#
+# @author Régis Clouard
+
+# Visual rendering of the tortoise world.
+
+import sys
+import time
+if sys.version_info.major >= 3:
+    import tkinter as Tkinter
+else:
+    import Tkinter
+from cells import CELL_NAMES, GROUND
+
+class TortoiseFrame( Tkinter.Frame ):
+    """
+    This is the class for the window displaying the tortoise and its world.
+    It observes a TortoiseWorld and paces its game cycle.
+
+    The window is redrawn FRAME_RATE times per second whatever the
+    simulation speed: each frame plays the events due since the last
+    one and then redraws what changed. All the canvas items are created
+    once and then only moved or reconfigured.
+
+    With a player, e.g. a recording.Replay of the world, the events come
+    from the player instead of the brain, and a slider allows jumping
+    to any event.
+    """
+    FRAME_RATE = 30
+
+    def __init__( self, world, simulation_speed, player = None ):
+        """
+        Creates the visual rendering of the tortoise world.
+        At speed s, the simulation runs s / 2 time units per second.
+        """
+        Tkinter.Frame.__init__(self, None)
+        self.simulation_speed = simulation_speed
+        self.time_rate = simulation_speed / 2.0
+        self.frame_period = 1.0 / self.FRAME_RATE
+        self.tw = world
+        grid_size = world.grid_size
+        self.master.title('Tortoise World')
+        self.canvas = Tkinter.Canvas(self, width = 40 * grid_size, height = 40 * grid_size + 60, bg = 'white')
+        self.canvas.pack(expand = 1, anchor = Tkinter.CENTER)
+        self.pack()
+        self.tkraise()
+        self.images = {}
+        for img in ['wall', 'lettuce', 'pond', 'ground', 'stone', 'tortoise-n', 'tortoise-s', 'tortoise-w', 'tortoise-e', 'tortoise-dead', 'dog-n', 'dog-s', 'dog-w', 'dog-e', 'dog-a', ]:
+            self.images[img] = Tkinter.PhotoImage(file = './images/' + img + '.gif')
+        # The ground never changes, the other cells have their own item
+        self.cell_items = {}
+        for y in range(grid_size):
+            for x in range(grid_size):
+                self.canvas.create_image(x * 40, y  *40, image = self.images['ground'], anchor = Tkinter.NW)
+                cell = self.tw.worldmap.get(x, y)
+                if cell != GROUND:
+                    self.cell_items[(x, y)] = self.canvas.create_image(x * 40, y * 40, image = self.images[CELL_NAMES[cell]], anchor = Tkinter.NW)
+        # Set up a table for handling the tortoise images to use for each direction
+        self.direction_tortoise_image_table = ['tortoise-n', 'tortoise-e', 'tortoise-s', 'tortoise-w']
+        self.direction_dog_image_table = ['dog-n', 'dog-e', 'dog-s', 'dog-w', 'dog-a']
+        self.tortoise_item = self.canvas.create_image(world.xpos * 40, world.ypos * 40, image = self.images[self.tortoise_image()], anchor = Tkinter.NW)
+        self.dog_item = self.canvas.create_image(world.dog_position[0] * 40, world.dog_position[1] * 40, image = self.images[self.dog_image()], anchor = Tkinter.NW)
+        self.drawn = {self.tortoise_item: None, self.dog_item: None}
+        # Set up text item for drawing info
+        self.text_item = self.canvas.create_text(40, grid_size * 40, anchor = Tkinter.NW, text = '')
+        self.text = ''
+        self.dirty_cells = set()
+        self.tw.add_observer(self)
+        self.player = player if player is not None else world
+        self.slider = None
+        if player is not None:
+            self.slider = Tkinter.Scale(self, from_ = 0, to = player.recording.event_count, orient = Tkinter.HORIZONTAL,
+                                        length = 40 * grid_size, showvalue = True, label = 'Event', command = self.seek)
+            self.slider.pack(fill = Tkinter.X)
+
+    def run( self ):
+        self.sim_time = self.tw.current_time
+        self.last_frame = time.perf_counter()
+        self.after(1, self.frame)
+        self.mainloop()
+
+    def frame( self ):
+        """
+        Plays the events due since the previous frame, redraws and
+        schedules the next frame. When the simulation cannot keep up,
+        it slows down instead of delaying the frames.
+        """
+        now = time.perf_counter()
+        self.sim_time += (now - self.last_frame) * self.time_rate
+        self.last_frame = now
+        deadline = now + 0.8 * self.frame_period
+        player = self.player
+        while not player.is_over() and player.next_event_time() <= self.sim_time:
+            player.step()
+            if time.perf_counter() > deadline:
+                self.sim_time = self.tw.current_time
+                break
+        self.draw()
+        if self.slider is not None:
+            self.slider.set(player.position)
+        # A replay can still be sought once over
+        if not player.is_over() or self.slider is not None:
+            remaining = self.frame_period - (time.perf_counter() - now)
+            self.after(max(int(1000 * remaining), 1), self.frame)
+
+    def seek( self, value ):
+        """
+        Jumps to the event chosen with the slider.
+        """
+        position = int(value)
+        if position != self.player.position:
+            self.player.seek(position)
+            self.sim_time = self.tw.current_time
+            # Every cell may differ, including those with no item yet,
+            # e.g. lettuces eaten before the start of the replay
+            size = self.tw.grid_size
+            self.dirty_cells.update((x, y) for y in range(size) for x in range(size))
+
+    def draw( self ):
+        """
+        Redraws the changed cells, the tortoise, the dog and the text.
+        """
+        world = self.tw
+        for (x, y) in self.dirty_cells:
+            cell = world.worldmap.get(x, y)
+            if (x, y) in self.cell_items:
+                self.canvas.itemconfigure(self.cell_items[(x, y)], image = self.images[CELL_NAMES[cell]])
+            elif cell != GROUND:
+                self.cell_items[(x, y)] = self.canvas.create_image(x * 40, y * 40, image = self.images[CELL_NAMES[cell]], anchor = Tkinter.NW)
+                self.canvas.tag_raise(self.tortoise_item)
+                self.canvas.tag_raise(self.dog_item)
+        self.dirty_cells.clear()
+        self.move_item(self.tortoise_item, world.xpos, world.ypos, self.tortoise_image())
+        self.move_item(self.dog_item, world.dog_position[0], world.dog_position[1], self.dog_image())
+        # Display text information
+        text = 'Eaten: %2d Time: %4d Score: %3d Drink Level: %2d   Health: %2d Action: %-7s' % (world.eaten, int(world.current_time), world.score, world.drink_level, world.health, world.action)
+        if text != self.text:
+            self.canvas.itemconfigure(self.text_item, text = text)
+            self.text = text
+
+    def move_item( self, item, x, y, image ):
+        if self.drawn[item] != (x, y, image):
+            self.canvas.coords(item, x * 40, y * 40)
+            self.canvas.itemconfigure(item, image = self.images[image])
+            self.drawn[item] = (x, y, image)
+
+    def tortoise_image( self ):
+        if self.tw.health <= 0:
+            return 'tortoise-dead'
+        return self.direction_tortoise_image_table[self.tw.direction]
+
+    def dog_image( self ):
+        return self.direction_dog_image_table[self.tw.dog_direction]
+
+    def tortoise_moved( self, world ):
+        if world.update_current_place:
+            self.dirty_cells.add((world.xpos, world.ypos))
+
+    def dog_moved( self, world ):
+        pass
+
+    def is_terminated( self ):
+        return self.tw.is_terminated()
+
+    def is_win( self ):
+        return self.tw.win
@@ -12,109 +12,30 @@
 # @author Régis Clouard
 
 # Definition of the tortoise world
-# and its visual rendering.
-
-import sys
-if sys.version_info.major >= 3:
-    import tkinter as Tkinter
-else:
-    import Tkinter
-from math import *
+# and of the headless episode runner.
+# The visual rendering lives in tortoiseframe.py.
+
+import array
+import copy
+import itertools
 import random
+import struct
 import time
-from utils import *
-
-class TortoiseFrame( Tkinter.Frame ):
-    """
-    This is the class for the window displaying the tortoise and its world.
-    """
-
-    tortoise_image_on_canvas = False
-    
-    def __init__( self, grid_size, simulation_speed, tortoise_brain, mute ):
-        """
-        Creates the visual rendering of the tortoise world.
-        """
-        Tkinter.Frame.__init__(self, None)
-        self.mute = mute
-        if simulation_speed > 200:
-            self.simulation_speed = 200
-        else:
-            self.simulation_speed = simulation_speed
-        self.master.title('Tortoise World')
-        self.canvas = Tkinter.Canvas(self, width = 40 * grid_size, height = 40 * grid_size + 60, bg = 'white')
-        self.canvas.pack(expand = 1, anchor = Tkinter.CENTER)
-        self.pack()
-        self.tkraise()
-        self.dog_canvas = None
-        # Create the world
-        self.tw = TortoiseWorld(grid_size, tortoise_brain)
-        self.images = {}
-        for img in ['wall', 'lettuce', 'pond', 'ground', 'stone', 'tortoise-n', 'tortoise-s', 'tortoise-w', 'tortoise-e', 'tortoise-dead', 'dog-n', 'dog-s', 'dog-w', 'dog-e', 'dog-a', ]:
-            self.images[img] = Tkinter.PhotoImage(file = './images/' + img + '.gif')
-        for y in range(grid_size):
-            for x in range(grid_size):
-                self.canvas.create_image(x * 40, y  *40, image = self.images['ground'], anchor = Tkinter.NW)                
-                if self.tw.worldmap[y][x] != 'ground':
-                    self.canvas.create_image(x * 40, y * 40, image = self.images[self.tw.worldmap[y][x]], anchor = Tkinter.NW)
-        # Set up a table for handling the tortoise images to use for each direction
-        self.direction_tortoise_image_table = ['tortoise-n', 'tortoise-e', 'tortoise-s', 'tortoise-w']
-        self.direction_dog_image_table = ['dog-n', 'dog-e', 'dog-s', 'dog-w', 'dog-a']
-        # Set up text item for drawing info
-        self.text_item = self.canvas.create_text(40, grid_size * 40, anchor = Tkinter.NW, text = '')
-        self.win = False
-        if self.mute:
-            self.runWithoutGraphics()
-        else:
-            self.runWithGraphics()
-            
-    def runWithGraphics( self ):
-            self.after(1, self.step)
-            self.mainloop()
-
-    def runWithoutGraphics( self ):
-        while not self.is_terminated():
-            self.step()
-
-    def step( self ):
-        """
-        Manages the game cycle.
-        """
-        # Update current time
-        self.tw.current_time += 0.1
-
-        # Move the tortoise 
-        if self.tw.current_time >= self.tw.next_tortoise_time:
-            self.tw.step_tortoise()
-            # Update ground if necessary
-            if self.tw.update_current_place:
-                self.canvas.create_image(self.tw.xpos * 40, self.tw.ypos * 40, image = self.images[self.tw.worldmap[self.tw.ypos][self.tw.xpos]], anchor = Tkinter.NW)
-            # Redraw tortoise
-            tortoise_image = self.direction_tortoise_image_table[self.tw.direction]
-            if self.tw.health <= 0:
-                tortoiseImage = 'tortoise-dead'
-            if self.tortoise_image_on_canvas != False:
-                self.canvas.delete(self.tortoise_image_on_canvas)
-            self.tortoise_image_on_canvas = self.canvas.create_image(self.tw.xpos * 40, self.tw.ypos * 40, image = self.images[tortoise_image], anchor = Tkinter.NW)
-
-        # Move the dog
-        if self.tw.current_time >= self.tw.next_dog_time:
-            self.tw.step_dog()
-            dogImage = self.direction_dog_image_table[self.tw.dog_direction]
-            if self.dog_canvas != None:
-                self.canvas.delete(self.dog_canvas)
-            self.dog_canvas = self.canvas.create_image(self.tw.dog_position[0] * 40, self.tw.dog_position[1] * 40, image = self.images[dogImage], anchor = Tkinter.NW)
-
-        # Display text information
-        self.canvas.itemconfigure(self.text_item, text = 'Eaten: %2d Time: %4d Score: %3d Drink Level: %2d   Health: %2d Action: %-7s' % (self.tw.eaten, int(self.tw.current_time), self.tw.score, self.tw.drink_level, self.tw.health, self.tw.action))
-        if not self.mute and not self.is_terminated() and self.tw.current_time <= self.tw.MAX_TIME:
-            self.after(int(200 / self.simulation_speed), self.step)
+import diagnostics
+from utils import TimeBudget, TimeoutFunctionException, derive_seed
+from cells import Grid, GROUND, STONE, LETTUCE, POND, PASSABLE, IS_LETTUCE, IS_POND
 
-    def is_terminated( self ):
-        return self.tw.action == 'stop' 
+DIRECTIONTABLE = ((0, -1), (1, 0), (0, 1), (-1, 0), (0, 0)) # North, East, South, West, None
+# Rotations giving the position of the dog relative to the tortoise
+# (in front, on the right) for each direction of the tortoise
+ROTA = ((0, +1), (+1, 0), (0, -1), (-1, 0))
+ROTB = ((-1, 0), (0, +1), (+1, 0), (0, -1))
 
-    def is_win( self ):
-        return self.tw.win
+DOG_MOVED = 5 # the dog went on in its direction (otherwise dog_move is the new direction)
+# Event codes of the recordings: the action of the tortoise, or DOG_EVENT + dog_move
+TORTOISE_ACTIONS = ('None', 'eat', 'drink', 'left', 'right', 'forward', 'wait', 'stop')
+ACTION_CODES = dict((action, code) for code, action in enumerate(TORTOISE_ACTIONS))
+DOG_EVENT = len(TORTOISE_ACTIONS)
 
 class TortoiseWorld():
     """
@@ -128,33 +49,129 @@ class TortoiseWorld():
     MAX_DRINK = 100
     MAX_HEALTH = 100
     MAX_TIME = 5000
-    xpos, ypos = 1, 1
-    drink_level = 0
-    eaten = 0
-    current_time = 0.0
-    direction = 0 #north = 0, east = 1, south = 2, west = 3
-    worldmap = None
-    action = 'None'
-    next_tortoise_time = 0
-    next_dog_time = 0
-    update_current_place = False
-    score = 0
-    health = MAX_HEALTH
-    pain = False
-    lettuce_count = 0;
-
-    def __init__( self, grid_size, tortoise_brain ):
-        self.dog_position = [grid_size - 2, grid_size - 5]
+    MOVE_BUDGET = 1000 # seconds
+    EPISODE_BUDGET = None
+
+    def __init__( self, grid_size, tortoise_brain, worldmap = None, budget = None, seed = None ):
+        """
+        With a seed, the map and the dog draw from their own generators
+        derived from it. Otherwise both use the global random generator.
+        """
+        self.xpos, self.ypos = 1, 1
+        self.direction = 0 #north = 0, east = 1, south = 2, west = 3
+        self.eaten = 0
+        self.current_time = 0.0
+        self.action = self.last_action = 'None'
+        self.dog_move = DOG_MOVED
+        self.next_tortoise_time = 0
+        self.next_dog_time = 0
+        self.update_current_place = False
+        self.score = 0
+        self.seed = seed
+        if seed is None:
+            self.rng = map_rng = random
+        else:
+            self.rng = random.Random(derive_seed(seed, 'dog'))
+            map_rng = random.Random(derive_seed(seed, 'map'))
+        self.dog_position = list(dog_start(grid_size))
         self.dog_direction_vector = [0, 0]
         self.dog_direction = 0 #north = 0, east = 1, south = 2, west = 3
-        self.direction_table = [(0, -1), (1, 0), (0, 1), (-1, 0), (0, 0)]
+        self.direction_table = DIRECTIONTABLE
         self.drink_level = self.MAX_DRINK
-        self.create_worldmap(grid_size)
+        self.create_worldmap(grid_size, worldmap, map_rng)
+        # Changes of the map since its creation, as (cell index, previous cell, stamp)
+        # triples, so that restore() only rewrites the changed cells
+        self.journal = array.array('q')
+        self.map_shared = False
         self.grid_size = grid_size
         self.tortoise_brain = tortoise_brain
+        if tortoise_brain is not None:
+            self.think = tortoise_brain.think
+        # The sensor is updated in place at each move
+        self.sensor = Sensor(False, False, False, False, False, 0, 0, 0, 0, 1, 1, 0)
         self.health = self.MAX_HEALTH
         self.pain = False
         self.win = False
+        if budget is None:
+            budget = TimeBudget(self.MOVE_BUDGET, self.EPISODE_BUDGET)
+        self.budget = budget
+        self.budget.reset()
+        self.observers = []
+        self.recorder = self.events = None
+
+    def add_observer( self, observer ):
+        """
+        Registers an observer of the game cycle, e.g. a visual rendering.
+        The observer is notified through its tortoise_moved(world) and
+        dog_moved(world) methods.
+        """
+        self.observers.append(observer)
+
+    def record( self, recorder ):
+        """
+        Makes step() append the code of every event to recorder.events,
+        a bytearray, and call recorder.keyframe() after the first tortoise
+        move from next_keyframe events on (see recording.Recorder).
+        Unlike an observer, this costs no call per event.
+        """
+        self.recorder = recorder
+        self.events = recorder.events
+        self.step = self.step_recording
+
+    def step( self ):
+        """
+        Manages the game cycle: jumps to the next event time and moves
+        the tortoise or the dog, or both when they are due at the same
+        time (the tortoise first).
+        The two events are simply the next tortoise and dog times, so
+        scheduling allocates nothing.
+        """
+        event_time = self.next_event_time()
+        self.current_time = event_time
+        if self.next_tortoise_time == event_time:
+            self.step_tortoise()
+            if self.observers:
+                for observer in self.observers:
+                    observer.tortoise_moved(self)
+        if self.next_dog_time == event_time:
+            self.step_dog()
+            if self.observers:
+                for observer in self.observers:
+                    observer.dog_moved(self)
+
+    def step_recording( self ):
+        """
+        The step() of a recorded world, which also appends the code of
+        every event to self.events (see record()).
+        """
+        event_time = self.next_tortoise_time if self.next_tortoise_time <= self.next_dog_time else self.next_dog_time
+        self.current_time = event_time
+        events = self.events
+        if self.next_tortoise_time == event_time:
+            self.step_tortoise()
+            events.append(ACTION_CODES.get(self.last_action, 0))
+            if len(events) >= self.next_keyframe:
+                self.recorder.keyframe()
+            if self.observers:
+                for observer in self.observers:
+                    observer.tortoise_moved(self)
+        if self.next_dog_time == event_time:
+            self.step_dog()
+            events.append(DOG_EVENT + self.dog_move)
+            if self.observers:
+                for observer in self.observers:
+                    observer.dog_moved(self)
+
+    def next_event_time( self ):
+        if self.next_tortoise_time <= self.next_dog_time:
+            return self.next_tortoise_time
+        return self.next_dog_time
+
+    def is_terminated( self ):
+        return self.action == 'stop'
+
+    def is_over( self ):
+        return self.is_terminated() or self.next_event_time() > self.MAX_TIME
 
     def step_tortoise( self ):
         """
@@ -167,31 +184,67 @@ class TortoiseWorld():
         dx, dy = self.direction_table[self.direction]
 
         # Sensing
-        ahead = self.worldmap[self.ypos + dy][self.xpos + dx]
-        here = self.worldmap[self.ypos][self.xpos] 
-        free_ahead = (ahead not in ['stone', 'wall'])
-        lettuce_ahead = (ahead == 'lettuce')
-        lettuce_here = (here == 'lettuce')
-        water_ahead = (ahead == 'pond')
-        water_here = (here == 'pond')
+        cells, size = self.worldmap.cells, self.grid_size
+        ahead = cells[(self.ypos + dy) * size + self.xpos + dx]
+        here = cells[self.ypos * size + self.xpos]
+        free_ahead = PASSABLE[ahead]
+        lettuce_ahead = IS_LETTUCE[ahead]
+        lettuce_here = IS_LETTUCE[here]
+        water_ahead = IS_POND[ahead]
+        water_here = IS_POND[here]
 
         # See in which direction the dog is
         dgx, dgy = self.dog_position[0] - self.xpos, self.dog_position[1] - self.ypos
-        rota, rotb = [(0, +1), (+1, 0), (0, -1), (-1, 0)], [(-1, 0), (0, +1), (+1, 0), (0, -1)]
-        relX = rota[self.direction][0] * dgx + rotb[self.direction][0] * dgy
-        relY = rota[self.direction][1] * dgx + rotb[self.direction][1] * dgy
+        rota, rotb = ROTA[self.direction], ROTB[self.direction]
+        relX = rota[0] * dgx + rotb[0] * dgy
+        relY = rota[1] * dgx + rotb[1] * dgy
 
         # Current sensor
-        sensor = Sensor(free_ahead, lettuce_ahead, lettuce_here, water_ahead, water_here, self.drink_level, self.health, relX, relY, self.xpos, self.ypos, self.direction)
-        
-        timed_func = TimeoutFunction(self.tortoise_brain.think, 1000)
+        sensor = self.sensor
+        sensor.free_ahead = free_ahead
+        sensor.lettuce_ahead = lettuce_ahead
+        sensor.lettuce_here = lettuce_here
+        sensor.water_ahead = water_ahead
+        sensor.water_here = water_here
+        sensor.drink_level = self.drink_level
+        sensor.health_level = self.health
+        sensor.dog_front = relX
+        sensor.dog_right = relY
+        # A new position tuple only when the tortoise went forward
+        position = sensor.tortoise_position
+        if position[0] != self.xpos or position[1] != self.ypos:
+            sensor.tortoise_position = (self.xpos, self.ypos)
+        sensor.tortoise_direction = self.direction
+
         try:
-            start_time = time.time()
-            self.action = timed_func(sensor)
+            action = self.budget.call(self.think, sensor)
         except TimeoutFunctionException:
-            print("Timed out on a single move!")
-            self.action = 'wait'
+            diagnostics.log(diagnostics.INFO, "Timed out on a single move!")
+            action = 'wait'
+        self.perform(action, free_ahead, lettuce_here, water_here)
+
+    def replay_tortoise( self, action ):
+        """
+        Moves the tortoise one step forward with the given action
+        instead of asking the brain, e.g. to replay a recording.
+        """
+        self.current_time = self.next_tortoise_time
+        time_change = (int)(4 - (3 * float(self.drink_level) / self.MAX_DRINK))
+        self.next_tortoise_time = self.current_time + time_change
+        self.update_current_place = False
+        dx, dy = self.direction_table[self.direction]
+        cells, size = self.worldmap.cells, self.grid_size
+        ahead = cells[(self.ypos + dy) * size + self.xpos + dx]
+        here = cells[self.ypos * size + self.xpos]
+        self.perform(action, PASSABLE[ahead], IS_LETTUCE[here], IS_POND[here])
+
+    def perform( self, action, free_ahead, lettuce_here, water_here ):
+        """
+        Performs the action of the tortoise and updates the score.
+        """
+        self.action = self.last_action = action
         self.pain = False
+        dx, dy = self.direction_table[self.direction]
 
         # Perform action
         if self.action == 'left':
@@ -212,7 +265,7 @@ class TortoiseWorld():
         elif self.action == 'eat' and lettuce_here:
             self.drink_level = max(self.drink_level - 1, 0)
             self.eaten += 1
-            self.worldmap[self.ypos][self.xpos] = 'ground'
+            self.set_cell(self.xpos, self.ypos, GROUND)
             self.update_current_place = True
 
         elif self.action == 'drink' and water_here:
@@ -223,7 +276,7 @@ class TortoiseWorld():
 
         # Update score
         if self.eaten == self.lettuce_count:
-            print("You win!")
+            diagnostics.log(diagnostics.INFO, "You win!")
             self.action = "stop"
             self.win = True
         elif self.drink_level <= 0 or self.health <= 0:
@@ -236,6 +289,9 @@ class TortoiseWorld():
             self.action = "stop"
             self.health = 0
             self.pain = True
+        elif self.budget.isExhausted():
+            diagnostics.log(diagnostics.INFO, "Out of thinking time!")
+            self.action = "stop"
         self.score = self.eaten * 10 - int(self.current_time / 10.0)
 
     def step_dog( self ):
@@ -249,14 +305,15 @@ class TortoiseWorld():
         # The dog keeps moving - if possible and unless it decides to turn
         nx = self.dog_position[0]+self.dog_direction_vector[0]
         ny = self.dog_position[1]+self.dog_direction_vector[1]
-        if nx >= 1 and ny >= 1 and nx < self.grid_size - 1 and ny < self.grid_size - 1 and self.worldmap[ny][nx] not in ['stone', 'wall'] and random.randint(0, 3) != 0:
+        if nx >= 1 and ny >= 1 and nx < self.grid_size - 1 and ny < self.grid_size - 1 and PASSABLE[self.worldmap.get(nx, ny)] and self.rng.randint(0, 3) != 0:
             self.dog_position[0] = nx
             self.dog_position[1] = ny
+            self.dog_move = DOG_MOVED
         else:
             # Steer dog randomly - or towards the turtle
-            if random.randrange(0, 3) == 0:
-                self.dog_direction = random.randrange(0, 4)
-            elif random.randrange(0, 2) == 0:
+            if self.rng.randrange(0, 3) == 0:
+                self.dog_direction = self.rng.randrange(0, 4)
+            elif self.rng.randrange(0, 2) == 0:
                 if self.xpos > self.dog_position[0]:
                     self.dog_direction = 1
                 elif self.xpos < self.dog_position[0]:
@@ -279,56 +336,153 @@ class TortoiseWorld():
                 else:
                     self.dog_direction = 4
             self.dog_direction_vector = self.direction_table[self.dog_direction]
+            self.dog_move = self.dog_direction
 
-    def create_worldmap( self, grid_size ):
+    def replay_dog( self, dog_move ):
         """
-        Builds a random world map.
+        Moves the dog one step forward as recorded in dog_move: either
+        DOG_MOVED or the new direction of the dog.
         """
-        self.worldmap = [ [ ((y in [0, grid_size - 1] or  x in [0, grid_size - 1]) and 'wall') or 'ground'
-                        for x in range(grid_size)] for y in range(grid_size)]
-        self.worldmap[1][1] = 'pond'
-        # First put out the stones randomly
-        for i in range(int((grid_size - 2) ** 2 * self.STONE_PROBABILITY)):
-            ok = False
-            while not ok: 
-                (x, y) = random.randint(1, grid_size - 1), random.randint(1, grid_size - 1)
-                if self.worldmap[y][x] == 'ground':
-                    count_stones = 0
-                    count_walls = 0
-                    # Check that the stone will not be adjacent to two other stones, 
-                    # or one other stone and a wall.
-                    # This is to prevent the appearance of inaccessible areas.
-                    for dx in [-1, 0, 1]:
-                        for dy in [-1, 0, 1]:
-                           if self.worldmap[y + dy][x + dx] == 'stone':
-                               count_stones += 1
-                           if self.worldmap[y + dy][x + dx] == 'wall':
-                               count_walls += 1
-                    if count_stones == 0 or (count_stones <= 1 and count_walls == 0):
-                        self.worldmap[y][x] = 'stone'
-                        ok = True
-                    elif random.random() <= 0.1:
-                        ok = True
-        # Then put out the lettuces randomly
-        for i in range(int((grid_size - 2) ** 2 * self.LETTUCE_PROBABILITY)):
-            ok = False
-            while not ok: 
-                (x, y) = random.randint(1, grid_size - 1), random.randint(1, grid_size - 1)
-                if self.worldmap[y][x] == 'ground':
-                    self.worldmap[y][x] = 'lettuce'
-                    self.lettuce_count += 1;
-                    ok = True
-        # Finally put out the water ponds randomly
-        for i in range(int((grid_size - 2) ** 2 * self.WATER_PROBABILITY)):
-            ok = False
-            while not ok: 
-                (x, y) = random.randint(1, grid_size - 1), random.randint(1, grid_size - 1)
-                if self.worldmap[y][x] == 'ground':
-                    self.worldmap[y][x] = 'pond'
-                    ok = True
+        self.next_dog_time += 1.25
+        if self.dog_position[0] == self.xpos and self.dog_position[1] == self.ypos:
+            self.health -= 5
+        if dog_move == DOG_MOVED:
+            self.dog_position[0] += self.dog_direction_vector[0]
+            self.dog_position[1] += self.dog_direction_vector[1]
+        else:
+            self.dog_direction = dog_move
+            self.dog_direction_vector = self.direction_table[dog_move]
+        self.dog_move = dog_move
+
+    def set_cell( self, x, y, cell ):
+        """
+        Changes a cell of the map, recording the change in the journal.
+        A map shared with a fork is copied before its first change.
+        """
+        if self.map_shared:
+            self.worldmap = self.worldmap.copy()
+            self.map_shared = False
+        i = y * self.grid_size + x
+        self.journal.append(i)
+        self.journal.append(self.worldmap.cells[i])
+        self.journal.append(next(JOURNAL_STAMPS))
+        self.worldmap.set(x, y, cell)
+
+    def snapshot( self ):
+        """
+        Captures the state of the world, including the dog and the
+        random generator state, in a WorldSnapshot. The map itself is
+        not copied: restore() replays the journal backwards.
+        """
+        journal = self.journal
+        stamp = journal[-1] if journal else 0
+        return WorldSnapshot(self.get_state(), self.action, len(journal), stamp, self.rng.getstate())
+
+    def restore( self, snapshot ):
+        """
+        Brings the world back to a snapshot taken earlier on this world
+        (or on the world it was forked from, before the fork). Only the
+        cells changed since the snapshot are rewritten.
+        """
+        journal = self.journal
+        length = snapshot.journal_length
+        if length > len(journal) or (length > 0 and journal[length - 1] != snapshot.journal_stamp):
+            raise ValueError('The snapshot is not in the history of this world')
+        if len(journal) > length:
+            if self.map_shared:
+                self.worldmap = self.worldmap.copy()
+                self.map_shared = False
+            size = self.grid_size
+            for k in range(len(journal) - 3, length - 1, -3):
+                i = journal[k]
+                self.worldmap.set(i % size, i // size, journal[k + 1])
+            del journal[length:]
+        self.set_state(snapshot.state, snapshot.action)
+        self.rng.setstate(snapshot.rng_state)
+
+    def get_state( self ):
+        """
+        Returns the scalar state of the world (everything but the map
+        and the random generator) packed with SNAPSHOT_FORMAT.
+        """
+        budget = self.budget
+        return SNAPSHOT_FORMAT.pack(self.xpos, self.ypos, self.direction, self.drink_level, self.health, self.eaten, self.score,
+                                    self.current_time, self.next_tortoise_time, self.next_dog_time,
+                                    self.dog_position[0], self.dog_position[1], self.dog_direction, DIRECTIONTABLE.index(tuple(self.dog_direction_vector)),
+                                    budget.used, budget.moves, budget.move_overruns,
+                                    self.pain, self.win, self.update_current_place)
+
+    def set_state( self, state, action ):
+        """
+        Sets the scalar state of the world from get_state() bytes.
+        """
+        (self.xpos, self.ypos, self.direction, self.drink_level, self.health, self.eaten, self.score,
+         self.current_time, self.next_tortoise_time, self.next_dog_time,
+         dogx, dogy, self.dog_direction, heading,
+         self.budget.used, self.budget.moves, self.budget.move_overruns,
+         self.pain, self.win, self.update_current_place) = SNAPSHOT_FORMAT.unpack(state)
+        self.dog_position[0], self.dog_position[1] = dogx, dogy
+        self.dog_direction_vector = DIRECTIONTABLE[heading]
+        self.action = action
+
+    def fork( self, tortoise_brain = None ):
+        """
+        Returns an independent copy of the world, played by the given
+        brain (by default the same one). Both worlds share the map until
+        one of them changes it, and the fork gets its own random
+        generator starting from the current state.
+        """
+        world = copy.copy(self)
+        if tortoise_brain is not None:
+            world.tortoise_brain = tortoise_brain
+            world.think = tortoise_brain.think
+        world.dog_position = list(self.dog_position)
+        world.journal = array.array('q', self.journal)
+        world.sensor = Sensor(False, False, False, False, False, 0, 0, 0, 0, 1, 1, 0)
+        world.budget = copy.copy(self.budget)
+        world.observers = []
+        if self.recorder is not None:
+            # Forks are not recorded: back to the step() of the class
+            del world.step
+        world.recorder = world.events = None
+        world.rng = random.Random()
+        world.rng.setstate(self.rng.getstate())
+        self.map_shared = world.map_shared = True
+        return world
+
+    def create_worldmap( self, grid_size, worldmap = None, rng = random ):
+        """
+        Builds a random world map, or takes the given one.
+        """
+        if worldmap is None:
+            worldmap = generate_worldmap(grid_size, rng = rng)
+        self.worldmap = worldmap
+        self.lettuce_count = self.worldmap.counts[LETTUCE]
+
+
+# Layout of the scalar state of a world in a snapshot
+SNAPSHOT_FORMAT = struct.Struct('<7q d q d 4q d 2q 3?')
+JOURNAL_STAMPS = itertools.count(1)
+
+class WorldSnapshot():
+    """
+    The state of a world at some time, as returned by TortoiseWorld.snapshot().
+    """
+    __slots__ = ('state', 'action', 'journal_length', 'journal_stamp', 'rng_state')
 
+    def __init__( self, state, action, journal_length, journal_stamp, rng_state ):
+        self.state = state
+        self.action = action
+        self.journal_length = journal_length
+        self.journal_stamp = journal_stamp
+        self.rng_state = rng_state
 
 class Sensor():
+    """
+    What the tortoise perceives before each move.
+    A world reuses the same sensor for all the moves.
+    """
+    __slots__ = ('free_ahead', 'lettuce_ahead', 'lettuce_here', 'water_ahead', 'water_here', 'drink_level', 'health_level', 'dog_front', 'dog_right', 'tortoise_position', 'tortoise_direction')
 
     def __init__( self, free_ahead, lettuce_ahead, lettuce_here, water_ahead, water_here, drink_level, health_level, dog_front, dog_right, tortoisex, tortoisey, tortoise_direction ):
         self.free_ahead = free_ahead
@@ -342,3 +496,163 @@ class Sensor():
         self.dog_right = dog_right
         self.tortoise_position = (tortoisex, tortoisey)
         self.tortoise_direction = tortoise_direction
+
+
+def dog_start( grid_size ):
+    """
+    Returns the starting cell of the dog.
+    """
+    return (grid_size - 2, grid_size - 5)
+
+def stone_candidates( grid_size ):
+    """
+    Returns the index of the interior cells where a stone may be put:
+    all of them except the pond at (1, 1), its two neighbours (so that the
+    tortoise is never walled in at start) and the dog starting cell.
+    """
+    reserved = set()
+    for (x, y) in [(1, 1), (2, 1), (1, 2), dog_start(grid_size)]:
+        reserved.add(y * grid_size + x)
+    return [y * grid_size + x for y in range(1, grid_size - 1) for x in range(1, grid_size - 1)
+            if y * grid_size + x not in reserved]
+
+def reachable_cells( grid, start ):
+    """
+    Flood fills the passable cells from the start index.
+    Returns a bytearray marking the reachable cells with 1.
+    """
+    cells, size = grid.cells, grid.size
+    seen = bytearray(len(cells))
+    seen[start] = 1
+    stack = [start]
+    while stack:
+        i = stack.pop()
+        for j in (i - 1, i + 1, i - size, i + size):
+            if not seen[j] and PASSABLE[cells[j]]:
+                seen[j] = 1
+                stack.append(j)
+    return seen
+
+def generate_worldmap( grid_size, candidates = None, rng = random ):
+    """
+    Builds a random world map where every lettuce and pond can be reached.
+    Stones, then lettuces and ponds, are drawn without replacement from
+    the free cells. A single flood fill from the tortoise position then
+    finds the pockets enclosed by stones, which are filled with stone.
+    """
+    if candidates is None:
+        candidates = stone_candidates(grid_size)
+    interior = (grid_size - 2) ** 2
+    start = grid_size + 1
+    dog = dog_start(grid_size)
+    dog = dog[1] * grid_size + dog[0]
+    while True:
+        grid = Grid(grid_size)
+        grid.set(1, 1, POND)
+        cells = grid.cells
+        # First put out the stones randomly
+        stones = min(int(interior * TortoiseWorld.STONE_PROBABILITY), len(candidates))
+        for i in rng.sample(candidates, stones):
+            cells[i] = STONE
+        grid.counts[STONE] += stones
+        grid.counts[GROUND] -= stones
+        # Check the connectivity
+        seen = reachable_cells(grid, start)
+        free = []
+        pockets = []
+        for y in range(1, grid_size - 1):
+            for i in range(y * grid_size + 1, (y + 1) * grid_size - 1):
+                if cells[i] == GROUND:
+                    if seen[i]:
+                        free.append(i)
+                    else:
+                        pockets.append(i)
+        if len(pockets) > len(free) or (cells[dog] == GROUND and not seen[dog]):
+            # The tortoise is walled in a small area: draw again
+            continue
+        for i in pockets:
+            cells[i] = STONE
+        grid.counts[STONE] += len(pockets)
+        grid.counts[GROUND] -= len(pockets)
+        # Then put out the lettuces and the water ponds randomly
+        lettuces = min(int(interior * TortoiseWorld.LETTUCE_PROBABILITY), len(free))
+        ponds = min(int(interior * TortoiseWorld.WATER_PROBABILITY), len(free) - lettuces)
+        chosen = rng.sample(free, lettuces + ponds)
+        for i in chosen[:lettuces]:
+            cells[i] = LETTUCE
+        for i in chosen[lettuces:]:
+            cells[i] = POND
+        grid.counts[LETTUCE] += lettuces
+        grid.counts[POND] += ponds
+        grid.counts[GROUND] -= lettuces + ponds
+        return grid
+
+def generate_worldmaps( number, grid_size, rng = random ):
+    """
+    Builds a list of random world maps of the same size (bulk mode).
+    """
+    candidates = stone_candidates(grid_size)
+    return [generate_worldmap(grid_size, candidates, rng) for i in range(number)]
+
+class EpisodeResult():
+    """
+    The outcome of a single episode. The cause of its end is 'win',
+    'thirst', 'health' (killed by the stones and the dog), 'budget'
+    (out of thinking time) or 'timeout' (MAX_TIME reached).
+    """
+
+    def __init__( self, world, wall_time = None ):
+        self.seed = world.seed
+        self.grid_size = world.grid_size
+        self.score = world.score
+        self.time = world.current_time
+        self.win = world.win
+        self.eaten = world.eaten
+        self.lettuce_count = world.lettuce_count
+        self.think_time = world.budget.used
+        self.move_overruns = world.budget.move_overruns
+        self.budget_exhausted = world.budget.isExhausted()
+        self.steps = world.budget.moves
+        self.wall_time = wall_time
+        if world.win:
+            self.cause = 'win'
+        elif not world.is_terminated():
+            self.cause = 'timeout'
+        elif world.health <= 0:
+            self.cause = 'thirst' if world.drink_level <= 0 else 'health'
+        else:
+            self.cause = 'budget'
+
+def run_episode( grid_size, tortoise_brain, budget = None, seed = None, record = None, worldmap = None, episode = None ):
+    """
+    Plays a whole episode without any visual rendering
+    and returns its EpisodeResult.
+    With a seed, the map, the dog and the brain draw from separate
+    generators derived from it, so the episode can be replayed exactly.
+    With record, an open binary file, the recording of the episode
+    is appended to it (see recording.py), numbered episode.
+    A worldmap given (and then changed by the episode) replaces the
+    random one; with the seed of the episode, it is the same map.
+    The brain only needs init() and think(): seed() and end() are
+    called when it has them.
+    """
+    start = time.perf_counter()
+    diagnostics.trace("Episode of %s, grid %d, seed %s", type(tortoise_brain).__name__, grid_size, seed)
+    if seed is not None and hasattr(tortoise_brain, 'seed'):
+        tortoise_brain.seed(derive_seed(seed, 'agent'))
+    tortoise_brain.init(grid_size)
+    tw = TortoiseWorld(grid_size, tortoise_brain, worldmap, budget, seed)
+    if record is not None:
+        from recording import Recorder
+        recorder = Recorder(tw, seed, episode)
+    try:
+        while not tw.is_over():
+            tw.step()
+    except Exception:
+        diagnostics.dump(title = 'Episode failed at time %d, trace' % tw.current_time)
+        raise
+    if hasattr(tortoise_brain, 'end'):
+        tortoise_brain.end()
+    if record is not None:
+        recorder.write(record)
+    return EpisodeResult(tw, time.perf_counter() - start)
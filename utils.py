@@ -12,8 +12,8 @@
 # @author Régis Clouard
 
 import sys
-import inspect
 import heapq
+import hashlib
 
 class PriorityQueue:
     """
@@ -44,32 +44,112 @@ class PriorityQueue:
         return len(self.heap) == 0
 
 ## code to handle timeouts
-import signal
 class TimeoutFunctionException(Exception):
     """Exception to raise on a timeout"""
     pass
 
-class TimeoutFunction:
-    def __init__(self, function, timeout):
-        self.timeout = timeout
-        self.function = function
-
-    def handle_timeout(self, signum, frame):
-        raise TimeoutFunctionException()
-
-    def __call__(self, *args):
-        if not 'SIGALRM' in dir(signal):
-            return self.function(*args)
-        old = signal.signal(signal.SIGALRM, self.handle_timeout)
-        signal.alarm(self.timeout)
-        try:
-            result = self.function(*args)
-        finally:
-            signal.signal(signal.SIGALRM, old)
-        signal.alarm(0)
+## code to budget the thinking time of an agent
+import time
+class TimeBudget:
+    """
+      Measures the time spent in the moves of an agent with a monotonic
+      clock and checks it against a per-move and a per-episode budget
+      (in seconds, None for no limit).
+
+      Nothing is interrupted: a move that went over its budget is reported
+      by raising a TimeoutFunctionException once it returns, and the
+      episode budget is checked with isExhausted(). Since no signal is
+      involved, it behaves the same in any thread or process.
+    """
+    def __init__( self, move_budget = None, episode_budget = None ):
+        self.move_budget = move_budget
+        self.episode_budget = episode_budget
+        self.reset()
+
+    def reset( self ):
+        """ Starts a new episode."""
+        self.used = 0.0
+        self.moves = 0
+        self.move_overruns = 0
+
+    def call( self, function, argument ):
+        """ Calls function(argument), charging its duration to the budget."""
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        self.used += elapsed
+        self.moves += 1
+        if self.move_budget is not None and elapsed > self.move_budget:
+            self.move_overruns += 1
+            raise TimeoutFunctionException()
         return result
 
+    def isExhausted( self ):
+        """ Returns true if the episode budget is spent."""
+        return self.episode_budget is not None and self.used > self.episode_budget
+
+## code to derive independent random streams
+def derive_seed( *keys ):
+    """
+      Derives a 64-bit seed from a master seed and any keys, e.g.
+      derive_seed(master_seed, episode) or derive_seed(seed, 'dog').
+      The result is the same in every process and on every platform.
+    """
+    data = '/'.join(str(key) for key in keys).encode()
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], 'little')
+
+## code to compute running statistics
+import math
+
+def normal_quantile( confidence ):
+    """ Returns z such that [-z, z] holds confidence of a standard normal."""
+    from statistics import NormalDist
+    return NormalDist().inv_cdf(0.5 + confidence / 2.0)
+
+class RunningStats:
+    """
+      Mean and variance of a stream of values, updated one value at a
+      time with Welford's algorithm (numerically stable, O(1) memory).
+    """
+    def __init__( self ):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push( self, value ):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def variance( self ):
+        """ Returns the sample variance."""
+        if self.n < 2:
+            return 0.0
+        return self.m2 / (self.n - 1)
+
+    def interval( self, confidence = 0.95 ):
+        """ Returns the normal confidence interval of the mean."""
+        if self.n == 0:
+            return (float('-inf'), float('inf'))
+        half = normal_quantile(confidence) * math.sqrt(self.variance() / self.n)
+        return (self.mean - half, self.mean + half)
+
+def wilson_interval( successes, n, confidence = 0.95 ):
+    """
+      Returns the Wilson score interval of a success rate, which unlike
+      the normal interval stays within [0, 1] and works for rates near 0 or 1.
+    """
+    if n == 0:
+        return (0.0, 1.0)
+    z = normal_quantile(confidence)
+    p = float(successes) / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return (max(0.0, center - half), min(1.0, center + half))
+
 def raiseNotDefined():
+    import inspect
     fileName = inspect.stack()[1][1]
     line = inspect.stack()[1][2]
     method = inspect.stack()[1][3]